@@ -4,6 +4,11 @@ import sys
 from pyrogram import Client, idle
 from src.bot import register_handlers
 from src.config import API_ID, API_HASH, SESSION_FOLDER
+from src.workers import start_workers, stop_workers, format_memory_report
+from src.load_shedding import shedder
+from src.watchdog import watchdog
+from src.peer_cache import peer_cache
+from src.recorder import recorder
 from loguru import logger
 
 logger.remove()
@@ -17,12 +22,26 @@ async def main():
         api_hash=API_HASH
     ) as app:
         register_handlers(app)
+        monitor = asyncio.create_task(shedder.monitor(app))
+        watchdog.start(app)
+        # Диалоги обходятся в фоне и кэшируются, а не перебираются при старте
+        peer_cache.start(app)
+        recorder.start()
         logger.info("Userbot запущен.")
-        async for dialog in app.get_dialogs():
-            logger.info(dialog.chat.first_name or dialog.chat.title)
         await idle()
+        peer_cache.stop()
+        monitor.cancel()
+        watchdog.stop()
+        recorder.stop()
     
     logger.info("Userbot остановлен.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Воркеры (и перезапущенные тоже) форкаются из отдельного fork-сервера,
+    # а не из процесса бота с потоками Pyrogram
+    if start_workers(log_level="DEBUG"):
+        logger.info(f"Память классификатора:\n{format_memory_report()}")
+    try:
+        asyncio.run(main())
+    finally:
+        stop_workers()
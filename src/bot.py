@@ -1,8 +1,16 @@
 from pyrogram import Client, filters
+from pyrogram.errors import PeerIdInvalid, ChannelInvalid
 from loguru import logger
 from src.config import API_ID, API_HASH, OWNER_ID, KEYWORDS_FILE, FUZZY_THRESHOLD, SPAM_FILE
 from src.keywords import load_keywords, add_keyword, remove_keyword, load_spam_patterns, add_spam_pattern, remove_spam_pattern
-from src.utils import simple_keyword_match
+from src.workers import run, format_memory_report
+from src.edit_cache import edit_cache, analyze_message, reanalyze_message
+from src.load_shedding import shedder
+from src.watchdog import watchdog
+from src.peer_cache import peer_cache
+from src.telemetry import telemetry
+from src.recorder import recorder
+from src.utils import TIER_FULL, SPACY_TIERS
 import sys
 import logging
 import os
@@ -27,6 +35,55 @@ async def owner_filter(_, __, message):
     logger.debug(f"owner_filter: from_user={getattr(message, 'from_user', None)}")
     return message.from_user and message.from_user.id == OWNER_ID
 
+async def run_tier(tier, func, *args):
+    """
+    Тиры со spaCy выполняются в воркерах, дешёвые (exact, spam_only) — в
+    родителе: им нужен LEMMA_CACHE, полный только здесь, а очередь пула при
+    перегрузке и так длинная.
+    """
+    if tier in SPACY_TIERS:
+        return await run(func, *args)
+    return func(*args)
+
+async def notify_match(client, message, verdict, edited=False):
+    """Уведомление о совпадении и пересылка сообщения в «Избранное»."""
+    text = message.text or ""
+    matches_str = ', '.join(verdict.matches)
+    tier_note = f" [тир {verdict.tier}]" if verdict.tier != TIER_FULL else ""
+    logger.info(f"Совпадение ключей{' (правка)' if edited else ''}{tier_note}: {matches_str} в чате {message.chat.id} ({message.chat.type})")
+    peer_cache.remember_chat(message.chat)
+    notify_text = (
+        f"🔔 Совпадение по ключам{' (после редактирования)' if edited else ''}{tier_note}: {matches_str}\n"
+        f"Чат: {peer_cache.title(message.chat)} ({message.chat.type})\n"
+        f"Пользователь: {message.from_user.first_name if message.from_user else 'N/A'}\n"
+        f"Текст:\n{text[:500]}"
+    )
+    link = peer_cache.link(message.chat.id, message.id)
+    if link:
+        notify_text += f"\n[Открыть сообщение]({link})"
+    await client.send_message("me", notify_text, disable_web_page_preview=True)
+    try:
+        await client.forward_messages("me", message.chat.id, message.id)
+        logger.debug(f"Переслано сообщение {message.id} из чата {message.chat.id} в избранное.")
+    except (ValueError, PeerIdInvalid, ChannelInvalid) as e:
+        # Пира нет в сессии: Pyrogram бросает PeerIdInvalid (или ChannelInvalid
+        # от GetChannels без access_hash), а ValueError — для id вне диапазона
+        if isinstance(e, ValueError) and "Peer id invalid" not in str(e):
+            logger.warning(f"Ошибка пересылки сообщения: {e}")
+            return
+        # Восстанавливаем пир из кэша и пробуем ещё раз
+        if await peer_cache.restore(client, message.chat.id):
+            try:
+                await client.forward_messages("me", message.chat.id, message.id)
+                logger.debug(f"Переслано после восстановления пира {message.chat.id}.")
+                return
+            except Exception as e2:
+                logger.debug(f"Пересылка после восстановления не удалась: {e2}")
+        peer_cache.defer_forward(message.chat.id, message.id)
+        logger.warning(f"Ошибка пересылки: пир {message.chat.id} не найден. Пересылка отложена до повторного резолва пира. Подробнее: {e}")
+    except Exception as e:
+        logger.warning(f"Неизвестная ошибка пересылки сообщения: {e}")
+
 def register_handlers(app: Client):
     @app.on_message(filters.command("start") & filters.private)
     async def start_handler(client, message):
@@ -462,13 +519,18 @@ def register_handlers(app: Client):
             "(узнать текущее количество групп: /showgroups)\n\n"
             "📊 Мониторинг качества:\n"
             "/stats — показать статистику качества совпадений\n"
-            "/clear_stats — очистить статистику\n\n"
+            "/clear_stats — очистить статистику\n"
+            "/workers — память воркеров классификатора\n"
+            "/profile <сек> [flame] — профиль хэндлеров и воркеров за окно\n"
+            "/lag — гистограмма лага event loop и последние блокировки\n"
+            "/rulestats [reset] — мёртвые и дорогие ключи и спам-шаблоны\n\n"
             "/help — эта справка\n\n"
             "ℹ️ Описание фильтров:\n"
             "- Спам-фильтр: regex из spam_patterns.txt\n"
             "- Прямой match: минимум 2 ключевых слова и хотя бы одна группа 'network'\n"
             "- Semantic shortcut: группы 'network'+'connect' или 'network'+'complaint'\n"
             "- Semantic proximity: минимум 2 группы и ≤10 токенов между найденными леммами\n"
+            "- Правки сообщений: переоцениваются изменённые строки, уведомление только при смене вердикта на «принято»\n"
             "\n"
         )
         await message.reply_text(help_text)
@@ -511,39 +573,141 @@ def register_handlers(app: Client):
         else:
             await message.reply_text("📊 Файл статистики не найден.")
 
+    @app.on_message(filters.command("workers") & filters.create(owner_filter))
+    async def workers_handler(client, message):
+        """
+        Показать память воркеров классификатора (уникальная/общая).
+        """
+        await message.reply_text(f"🧠 Память классификатора:\n\n{format_memory_report()}")
+
+    @app.on_message(filters.command("lag") & filters.create(owner_filter))
+    async def lag_handler(client, message):
+        """
+        Гистограмма лага event loop и последние блокировки.
+        """
+        await message.reply_text(f"🐢 Лаг event loop:\n\n{watchdog.format_report()}"[:4000])
+
+    @app.on_message(filters.command("rulestats") & filters.create(owner_filter))
+    async def rulestats_handler(client, message):
+        """
+        Телеметрия правил: /rulestats — отчёт, /rulestats reset — сбросить счётчики
+        """
+        from src.utils import compile_keywords, SPAM_PATTERNS
+
+        parts = message.text.split()
+        if len(parts) > 1 and parts[1].lower() == "reset":
+            telemetry.reset()
+            await message.reply_text("📈 Счётчики правил сброшены.")
+            return
+        tables = compile_keywords()
+        effective = set(tables.originals)
+        report = telemetry.report(
+            tables.originals,
+            SPAM_PATTERNS,
+            [tables.originals[k] for _, k in tables.single_lemmas],
+            merged=[k for k in load_keywords(KEYWORDS_FILE) if k not in effective],
+        )
+        for i in range(0, len(report), 4000):
+            await message.reply_text(f"📈 Телеметрия правил:\n\n{report[i:i+4000]}" if i == 0 else report[i:i+4000])
+
+    @app.on_message(filters.command("profile") & filters.create(owner_filter))
+    async def profile_handler(client, message):
+        """
+        Профилирование хэндлеров и воркеров: /profile <секунды> [flame]
+        """
+        from src.profiler import profile_window, is_active
+
+        parts = message.text.split()
+        try:
+            seconds = int(parts[1]) if len(parts) > 1 else 60
+        except ValueError:
+            await message.reply_text("Использование: /profile <секунды> [flame]")
+            return
+        seconds = max(1, min(seconds, 600))
+        flame = len(parts) > 2 and parts[2].lower() == "flame"
+        if is_active():
+            await message.reply_text("Профилирование уже запущено.")
+            return
+        await message.reply_text(f"⏱ Профилирование запущено на {seconds} с...")
+        try:
+            report, collapsed = await profile_window(seconds, flame=flame)
+        except Exception as e:
+            await message.reply_text(f"Ошибка профилирования: {str(e)}")
+            return
+        for i in range(0, len(report), 4000):
+            await message.reply_text(f"⏱ Профиль:\n\n{report[i:i+4000]}" if i == 0 else report[i:i+4000])
+        if collapsed:
+            await message.reply_document(collapsed, caption="Collapsed stacks для flamegraph")
+
     @app.on_message(filters.text)
     async def all_messages_handler(client, message):
         logger.debug(f"all_messages_handler: chat_id={message.chat.id}, chat_type={message.chat.type}, user_id={getattr(message.from_user, 'id', None)}, text={message.text[:50] if message.text else ''}")
         try:
             text = message.text or ""
-            # Используем простую функцию поиска
-            matches = simple_keyword_match(text)
-            if matches:
-                matches_str = ', '.join(matches)
-                logger.info(f"Совпадение ключей: {matches_str} в чате {message.chat.id} ({message.chat.type})")
-                notify_text = (
-                    f"🔔 Совпадение по ключам: {matches_str}\n"
-                    f"Чат: {message.chat.title or message.chat.id} ({message.chat.type})\n"
-                    f"Пользователь: {message.from_user.first_name if message.from_user else 'N/A'}\n"
-                    f"Текст:\n{text[:500]}"
-                )
-                if str(message.chat.id).startswith("-100") and hasattr(message, "id"):
-                    chat_id_num = str(message.chat.id)[4:]
-                    notify_text += f"\n[Открыть сообщение](https://t.me/c/{chat_id_num}/{message.id})"
-                await client.send_message("me", notify_text, disable_web_page_preview=True)
-                try:
-                    await client.forward_messages("me", message.chat.id, message.id)
-                    logger.debug(f"Переслано сообщение {message.id} из чата {message.chat.id} в избранное.")
-                except ValueError as e:
-                    if "Peer id invalid" in str(e):
-                        logger.warning(f"Ошибка пересылки: Peer id invalid ({message.chat.id}). Скорее всего, userbot не состоит в этом чате или Pyrogram не видит его в сессии. Пересылка невозможна. Подробнее: {e}")
-                    else:
-                        logger.warning(f"Ошибка пересылки сообщения: {e}")
-                except Exception as e:
-                    logger.warning(f"Неизвестная ошибка пересылки сообщения: {e}")
+            peer_cache.remember_chat(message.chat)
+            # Используем простую функцию поиска (леммы сохраняем для будущих правок)
+            tier = shedder.enter()
+            try:
+                with watchdog.track(message):
+                    verdict, tokens = await run_tier(tier, analyze_message, text, tier)
+            finally:
+                shedder.leave()
+            key = (message.chat.id, message.id)
+            edit_cache.put(key, text, tokens, verdict)
+            recorder.record(message, verdict)
+            if verdict.deferred:
+                shedder.defer(message)
+            elif verdict and edit_cache.claim_notify(key):
+                await notify_match(client, message, verdict)
         except Exception as e:
             logger.error(f"Ошибка в обработчике сообщений: {e}")
 
+    async def deferred_check(client, message):
+        """Полная переоценка сообщения, пропущенного в тире spam_only."""
+        text = message.text or ""
+        key = (message.chat.id, message.id)
+        entry = edit_cache.get(key)
+        # Сообщение успели отредактировать (правку проверил свой хэндлер)
+        # или по нему уже отправлено уведомление
+        if entry is not None and (entry.notified or entry.text_hash != edit_cache.text_hash(text)):
+            return
+        with watchdog.track(message):
+            verdict, tokens = await run(analyze_message, text, TIER_FULL)
+        edit_cache.put(key, text, tokens, verdict)
+        if verdict and edit_cache.claim_notify(key):
+            await notify_match(client, message, verdict)
+
+    shedder.on_deferred = deferred_check
+
+    @app.on_edited_message(filters.text)
+    async def edited_messages_handler(client, message):
+        logger.debug(f"edited_messages_handler: chat_id={message.chat.id}, message_id={message.id}")
+        try:
+            text = message.text or ""
+            key = (message.chat.id, message.id)
+            entry = edit_cache.get(key)
+            if entry is not None and entry.text_hash == edit_cache.text_hash(text):
+                return
+            tier = shedder.enter()
+            try:
+                with watchdog.track(message):
+                    verdict, tokens = await run_tier(
+                        tier, reanalyze_message, text, entry.tokens if entry else None, tier,
+                    )
+            finally:
+                shedder.leave()
+            # Уведомляем один раз на сообщение, при первом вердикте «принято»;
+            # без записи в кэше (вытеснена, бот перезапущен) неизвестно, было ли
+            # уведомление — не уведомляем и не откладываем, чтобы не повторить его
+            edit_cache.put(key, text, tokens, verdict, notified=entry is None)
+            if verdict.deferred:
+                if entry is not None:
+                    shedder.defer(message)
+            elif verdict and entry is not None and edit_cache.claim_notify(key):
+                await notify_match(client, message, verdict, edited=True)
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике правок: {e}")
+
     # --- Закомментированные старые функции поиска ---
     # def smart_find_match(text, keywords, context="", threshold=85):
     #     ...
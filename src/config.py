@@ -11,4 +11,55 @@ FUZZY_THRESHOLD = int(os.getenv("FUZZY_THRESHOLD", "80"))
 KEYWORDS_FILE = os.getenv("KEYWORDS_FILE", "keywords.txt")
 SPAM_FILE = os.getenv("SPAM_FILE", "spam_patterns.txt")
 SESSION_FOLDER = os.path.join(os.getcwd(), "sessions")
-os.makedirs(SESSION_FOLDER, exist_ok=True)
\ No newline at end of file
+os.makedirs(SESSION_FOLDER, exist_ok=True)
+
+# Префорк-воркеры классификатора (0 — классификация в основном процессе)
+CLASSIFIER_WORKERS = int(os.getenv("CLASSIFIER_WORKERS", "0"))
+# Сколько сообщений обрабатывает воркер до перезапуска (0 — без перезапуска)
+WORKER_MAX_TASKS = int(os.getenv("WORKER_MAX_TASKS", "1000"))
+# Сколько ждать ответа воркера (с): задача убитого воркера (OOM, SIGKILL)
+# не завершается никогда, и после таймаута выполняется в основном процессе
+WORKER_TASK_TIMEOUT = float(os.getenv("WORKER_TASK_TIMEOUT", "10"))
+
+# Сколько последних сообщений хранить для переоценки правок
+EDIT_CACHE_SIZE = int(os.getenv("EDIT_CACHE_SIZE", "5000"))
+
+# Размер кэша «словоформа → лемма» (используется тиром exact)
+LEMMA_CACHE_SIZE = int(os.getenv("LEMMA_CACHE_SIZE", "200000"))
+
+# Адаптивная разгрузка: пороги глубины очереди и лага event loop (с)
+# для перехода в тиры no_fuzzy, exact и spam_only
+LOAD_SHEDDING = os.getenv("LOAD_SHEDDING", "0") == "1"
+SHED_DEPTH = [int(x) for x in os.getenv("SHED_DEPTH", "20,50,100").split(",")]
+SHED_LAG = [float(x) for x in os.getenv("SHED_LAG", "0.5,1.5,3").split(",")]
+SHED_DEFERRED_MAX = int(os.getenv("SHED_DEFERRED_MAX", "1000"))
+
+# Длинные сообщения: порог (символов; с запасом ниже лимита Telegram в 4096,
+# иначе ограниченный путь почти не срабатывает), жёсткий предел просмотра
+# (символов) и бюджет слов, которые проходят через spaCy
+LONG_TEXT_CHARS = int(os.getenv("LONG_TEXT_CHARS", "1500"))
+LONG_TEXT_MAX_CHARS = int(os.getenv("LONG_TEXT_MAX_CHARS", "100000"))
+LONG_TEXT_TOKEN_BUDGET = int(os.getenv("LONG_TEXT_TOKEN_BUDGET", "600"))
+
+# Сторожевой таймер event loop: период замера, порог блокировки (с)
+# и минимальный интервал между отчётами владельцу (с)
+WATCHDOG_INTERVAL = float(os.getenv("WATCHDOG_INTERVAL", "0.1"))
+WATCHDOG_THRESHOLD = float(os.getenv("WATCHDOG_THRESHOLD", "0.5"))
+WATCHDOG_NOTIFY_INTERVAL = float(os.getenv("WATCHDOG_NOTIFY_INTERVAL", "60"))
+
+# Время жизни записей кэша пиров/чатов до повторного прогрева (с)
+PEER_CACHE_TTL = float(os.getenv("PEER_CACHE_TTL", str(6 * 3600)))
+
+# Телеметрия правил: время спам-regex замеряется на каждом N-м сообщении
+TELEMETRY_SAMPLE_EVERY = int(os.getenv("TELEMETRY_SAMPLE_EVERY", "50"))
+
+# Нормализация текста (транслит, дефисы, смешанные алфавиты, повторы букв)
+NORMALIZE_TEXT = os.getenv("NORMALIZE_TEXT", "1") == "1"
+
+# Выборочная запись трафика: доля сообщений (0 — выключено), каталог,
+# размер сегмента (MB несжатых данных), анонимизация и размер очереди
+RECORD_SAMPLE_RATE = float(os.getenv("RECORD_SAMPLE_RATE", "0"))
+RECORD_DIR = os.getenv("RECORD_DIR", "recordings")
+RECORD_SEGMENT_MB = float(os.getenv("RECORD_SEGMENT_MB", "64"))
+RECORD_ANONYMIZE = os.getenv("RECORD_ANONYMIZE", "1") == "1"
+RECORD_QUEUE_SIZE = int(os.getenv("RECORD_QUEUE_SIZE", "10000"))
@@ -0,0 +1,184 @@
+"""
+Кэш вердиктов для инкрементальной переоценки отредактированных сообщений.
+
+Для каждого сообщения (chat.id, message.id) хранится хэш текста, токены с
+леммами и вердикт simple_keyword_match. При редактировании новый текст только
+токенизируется (без тэггера и лемматизатора), токены сравниваются с прежними
+через difflib, и через spaCy проходят лишь изменённые участки вместе с
+EDIT_CONTEXT соседними токенами с каждой стороны; леммы остальных токенов
+берутся из кэша. Сопоставление выполняется теми же таблицами (match_verdict),
+что и для новых сообщений.
+
+Под нагрузкой анализ выполняется в тире из load_shedding; токены сохраняются
+только для тиров, где работал spaCy. Вердикт дешёвого тира (exact, spam_only)
+не вытесняет полный: в записи остаются токены и вердикт полного анализа, а
+флаг notified помнит, что уведомление уже отправлено.
+"""
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+
+from src.config import EDIT_CACHE_SIZE, LONG_TEXT_CHARS
+from src.normalize import normalize
+from src.utils import (
+    nlp, is_spam, match_verdict, token_lemma, classify,
+    Verdict, TIER_FULL, SPACY_TIERS, BRANCH_SPAM,
+)
+
+# Токены сообщения: (текст токена, лемма или None для не-буквенных токенов)
+Tokens = list[tuple[str, str | None]]
+
+# Сколько соседних токенов перелемматизируется вокруг изменённого участка:
+# лемма зависит от части речи, а тэггер смотрит на соседей
+EDIT_CONTEXT = 5
+# Если изменилась бо́льшая доля токенов, дешевле проанализировать текст целиком
+EDIT_MAX_CHANGED = 0.5
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def _lemmas(tokens: Tokens) -> list[str]:
+    return [lemma for _, lemma in tokens if lemma is not None]
+
+
+def analyze_message(text: str, tier: str = TIER_FULL) -> tuple[Verdict, Tokens]:
+    """
+    Анализ нового сообщения: вердикт и токены с леммами.
+    Текст лемматизируется целиком, как в simple_keyword_match, поэтому
+    вердикт совпадает с ним.
+    """
+    text = str(text)
+    # Длинные тексты идут через ограниченный по стоимости путь, без кэша токенов
+    if tier not in SPACY_TIERS or len(text) > LONG_TEXT_CHARS:
+        return classify(text, tier), []
+    text = normalize(text)
+    if is_spam(text.lower()):
+        return Verdict(None, tier, branch=BRANCH_SPAM), []
+    tokens = [(t.text, token_lemma(t) if t.is_alpha else None) for t in nlp(text)]
+    return match_verdict(_lemmas(tokens), tier), tokens
+
+
+def _windows(opcodes, size: int) -> list[tuple[int, int]]:
+    """Участки нового текста (в токенах) для перелемматизации, с контекстом."""
+    windows: list[tuple[int, int]] = []
+    for op, _, _, j1, j2 in opcodes:
+        if op == "equal":
+            continue
+        start, end = max(0, j1 - EDIT_CONTEXT), min(size, j2 + EDIT_CONTEXT)
+        if start == end:
+            continue
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def reanalyze_message(
+    text: str, previous: Tokens | None, tier: str = TIER_FULL,
+) -> tuple[Verdict, Tokens]:
+    """
+    Переоценка отредактированного сообщения: через spaCy проходят только
+    изменённые участки текста с контекстом.
+    """
+    if not previous or tier not in SPACY_TIERS or len(text) > LONG_TEXT_CHARS:
+        return analyze_message(text, tier)
+    raw, text = text, normalize(str(text))
+    if is_spam(text.lower()):
+        return Verdict(None, tier, branch=BRANCH_SPAM), []
+    doc = nlp.tokenizer(text)
+    words = [t.text for t in doc]
+    matcher = SequenceMatcher(None, [w for w, _ in previous], words, autojunk=False)
+    windows = _windows(matcher.get_opcodes(), len(doc))
+    if sum(end - start for start, end in windows) > EDIT_MAX_CHANGED * len(doc):
+        return analyze_message(raw, tier)
+
+    lemmas: list[str | None] = [None] * len(doc)
+    for i1, j1, size in matcher.get_matching_blocks():
+        for k in range(size):
+            lemmas[j1 + k] = previous[i1 + k][1]
+    # Участки лемматизируются заново; токены сопоставляются по смещению в тексте
+    spans = [doc[start:end] for start, end in windows]
+    for span, part in zip(spans, nlp.pipe(span.text for span in spans)):
+        by_offset = {span.start_char + t.idx: t for t in part}
+        for token in span:
+            fresh = by_offset.get(token.idx)
+            if fresh is None or fresh.text != token.text:
+                # Участок токенизировался иначе, чем весь текст — анализируем целиком
+                return analyze_message(raw, tier)
+            lemmas[token.i] = token_lemma(fresh) if fresh.is_alpha else None
+    tokens = list(zip(words, lemmas))
+    return match_verdict(_lemmas(tokens), tier), tokens
+
+
+def _is_full(verdict: Verdict) -> bool:
+    return verdict.tier in SPACY_TIERS and not verdict.deferred
+
+
+@dataclass
+class CacheEntry:
+    text_hash: bytes
+    tokens: Tokens
+    verdict: Verdict
+    notified: bool = False
+
+
+class EditCache:
+    """Ограниченный LRU-кэш вердиктов по (chat.id, message.id)."""
+
+    def __init__(self, maxsize: int = EDIT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: OrderedDict[tuple[int, int], CacheEntry] = OrderedDict()
+
+    def get(self, key: tuple[int, int]) -> CacheEntry | None:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple[int, int], text: str, tokens: Tokens, verdict: Verdict,
+            notified: bool = False):
+        """
+        Сохраняет вердикт. notified задаёт флаг только новой записи: правка без
+        записи в кэше создаёт её с notified=True — было ли уведомление,
+        неизвестно, и ни отложенная проверка, ни следующие правки не уведомляют.
+        """
+        if self.maxsize <= 0:
+            return
+        entry = self._data.get(key)
+        if entry is None:
+            self._data[key] = CacheEntry(_digest(text), tokens, verdict, notified)
+        elif _is_full(verdict) or not _is_full(entry.verdict):
+            entry.text_hash, entry.tokens, entry.verdict = _digest(text), tokens, verdict
+        else:
+            # Дешёвый тир: хэш — от нового текста, токены и вердикт — от полного
+            entry.text_hash = _digest(text)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def claim_notify(self, key: tuple[int, int]) -> bool:
+        """
+        Отмечает, что по сообщению отправлено уведомление; False — если оно
+        уже было отправлено раньше.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return True
+        if entry.notified:
+            return False
+        entry.notified = True
+        return True
+
+    @staticmethod
+    def text_hash(text: str) -> bytes:
+        return _digest(text)
+
+    def __len__(self):
+        return len(self._data)
+
+
+edit_cache = EditCache()
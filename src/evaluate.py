@@ -0,0 +1,226 @@
+"""
+Офлайн-оценка классификатора на размеченном корпусе.
+
+Корпус — JSONL со строками {"text": ..., "label": 1|0, "group": "..."}
+(group необязателен: ожидаемая семантическая группа сообщения). Сообщения
+классифицируются пулом процессов на всех ядрах: модель и таблицы ключей
+загружаются один раз в родителе до fork, как у воркеров бота. Отчёт —
+precision/recall в целом, по веткам решения и по группам, плюс список
+ошибочно классифицированных сообщений.
+
+Пример:
+    python -m src.evaluate labeled.jsonl
+    python -m src.evaluate labeled.jsonl --workers 8 --show 50 --errors errors.jsonl
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+# Конфиг требует реальные значения — для офлайн-прогона подойдут любые
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("OWNER_ID", "0")
+
+from loguru import logger
+
+from src import utils
+from src.utils import BRANCHES
+
+_POSITIVE = {"1", "true", "yes", "relevant", "positive"}
+_NEGATIVE = {"0", "false", "no", "irrelevant", "negative"}
+
+
+def _parse_label(value) -> bool | None:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in _POSITIVE:
+            return True
+        if value in _NEGATIVE:
+            return False
+    return None
+
+
+def iter_corpus(path: str):
+    """Потоково читает размеченный корпус: (номер строки, запись)."""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Строка {lineno}: некорректный JSON, пропущена")
+                continue
+            label = _parse_label(rec.get("label"))
+            if not rec.get("text") or label is None:
+                logger.warning(f"Строка {lineno}: нет text или label, пропущена")
+                continue
+            rec["label"] = label
+            yield lineno, rec
+
+
+def _classify(item: tuple[int, dict]) -> tuple[int, dict, bool, str, list[str], list[str] | None]:
+    """Выполняется в воркере: вердикт для одной записи корпуса."""
+    lineno, rec = item
+    verdict = utils.classify(rec["text"])
+    return lineno, rec, bool(verdict), verdict.branch, verdict.groups, verdict.matches
+
+
+@dataclass
+class Counts:
+    tp: int = 0
+    fp: int = 0
+    fn: int = 0
+    tn: int = 0
+
+    def add(self, predicted: bool, label: bool):
+        if predicted and label:
+            self.tp += 1
+        elif predicted:
+            self.fp += 1
+        elif label:
+            self.fn += 1
+        else:
+            self.tn += 1
+
+    @property
+    def total(self) -> int:
+        return self.tp + self.fp + self.fn + self.tn
+
+    @property
+    def precision(self) -> float:
+        return self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+
+    @property
+    def recall(self) -> float:
+        return self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+
+
+@dataclass
+class Evaluation:
+    overall: Counts = field(default_factory=Counts)
+    branches: dict[str, Counts] = field(default_factory=lambda: defaultdict(Counts))
+    groups: dict[str, Counts] = field(default_factory=lambda: defaultdict(Counts))
+    labeled_groups: dict[str, Counts] = field(default_factory=lambda: defaultdict(Counts))
+    errors: list[dict] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def add(self, lineno: int, rec: dict, predicted: bool, branch: str, groups: list[str], matches):
+        label = rec["label"]
+        self.overall.add(predicted, label)
+        self.branches[branch].add(predicted, label)
+        for group in groups:
+            self.groups[group].add(predicted, label)
+        if rec.get("group"):
+            self.labeled_groups[rec["group"]].add(predicted, label)
+        if predicted != label:
+            self.errors.append({
+                "line": lineno,
+                "kind": "FP" if predicted else "FN",
+                "branch": branch,
+                "groups": groups,
+                "matches": matches,
+                "text": rec["text"],
+            })
+
+
+def evaluate(path: str, processes: int, chunksize: int = 64) -> Evaluation:
+    """Прогоняет корпус через classify в пуле процессов."""
+    result = Evaluation()
+    started = time.perf_counter()
+    if processes <= 1:
+        for item in iter_corpus(path):
+            result.add(*_classify(item))
+    else:
+        # Всё, что должно стать общим, загружаем до fork и замораживаем кучу
+        # (как fork-сервер воркеров бота, см. src/worker_server.py)
+        utils.compile_keywords()
+        gc.collect()
+        gc.freeze()
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(processes=processes) as pool:
+            for row in pool.imap(_classify, iter_corpus(path), chunksize=chunksize):
+                result.add(*row)
+        gc.unfreeze()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _row(name: str, c: Counts) -> str:
+    return (
+        f"  {name:<12} n={c.total:<7} TP={c.tp:<6} FP={c.fp:<6} FN={c.fn:<6} "
+        f"P={c.precision:.3f} R={c.recall:.3f}"
+    )
+
+
+def format_report(ev: Evaluation, show: int = 20) -> str:
+    total = ev.overall.total
+    positives = ev.overall.tp + ev.overall.fn
+    lines = [
+        f"Сообщений: {total}, положительных: {positives}, "
+        f"время: {ev.elapsed:.1f} с ({total / ev.elapsed if ev.elapsed else 0:.0f} сообщ./с)",
+        "",
+        _row("итого", ev.overall),
+        "",
+        "По веткам решения (R — доля всех положительных, принятых веткой):",
+    ]
+    for branch in BRANCHES:
+        c = ev.branches.get(branch)
+        if c is None:
+            continue
+        share = c.tp / positives if positives else 0.0
+        lines.append(
+            f"  {branch:<12} n={c.total:<7} TP={c.tp:<6} FP={c.fp:<6} FN={c.fn:<6} "
+            f"P={c.precision:.3f} R={share:.3f}"
+        )
+    if ev.groups:
+        lines += ["", "По группам, найденным в тексте:"]
+        lines += [_row(g, ev.groups[g]) for g in sorted(ev.groups)]
+    if ev.labeled_groups:
+        lines += ["", "По размеченным группам:"]
+        lines += [_row(g, ev.labeled_groups[g]) for g in sorted(ev.labeled_groups)]
+    if ev.errors and show:
+        lines += ["", f"Ошибки (первые {min(show, len(ev.errors))} из {len(ev.errors)}):"]
+        for err in ev.errors[:show]:
+            text = err["text"].replace("\n", " ")
+            lines.append(
+                f"  [{err['kind']}] строка {err['line']}, ветка={err['branch']}, "
+                f"ключи={err['matches']}: {text[:160]}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Оценка классификатора на размеченном корпусе")
+    parser.add_argument("corpus", help="JSONL с полями text, label и (опционально) group")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов классификации")
+    parser.add_argument("--chunksize", type=int, default=64, help="сообщений в одной задаче пула")
+    parser.add_argument("--show", type=int, default=20, help="сколько ошибок вывести")
+    parser.add_argument("--errors", help="записать все ошибки в JSONL")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    ev = evaluate(args.corpus, args.workers, args.chunksize)
+    print(format_report(ev, args.show))
+    if args.errors:
+        with open(args.errors, "w", encoding="utf-8") as f:
+            for err in ev.errors:
+                f.write(json.dumps(err, ensure_ascii=False) + "\n")
+        print(f"\nОшибки записаны: {args.errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Адаптивная разгрузка под нагрузкой.
+
+Глубина очереди (сообщения в обработке + очередь апдейтов Pyrogram) и лаг
+event loop переводят классификатор на более дешёвые тиры:
+    full → no_fuzzy → exact → spam_only
+Опоздать с полной точностью для нас хуже, чем вовремя ответить с чуть
+меньшей полнотой. Сообщения, прошедшие в тире spam_only только спам-фильтр,
+откладываются и переоцениваются полностью, когда нагрузка спадает.
+"""
+import asyncio
+from collections import deque
+
+from loguru import logger
+from src.config import LOAD_SHEDDING, SHED_DEPTH, SHED_LAG, SHED_DEFERRED_MAX
+from src.utils import TIERS, TIER_FULL
+from src.watchdog import watchdog
+
+
+class LoadShedder:
+    def __init__(
+        self,
+        enabled: bool = LOAD_SHEDDING,
+        depth_thresholds: list[int] = SHED_DEPTH,
+        lag_thresholds: list[float] = SHED_LAG,
+        deferred_max: int = SHED_DEFERRED_MAX,
+    ):
+        self.enabled = enabled
+        self.depth_thresholds = depth_thresholds
+        self.lag_thresholds = lag_thresholds
+        self.inflight = 0
+        self.lag = 0.0
+        self.level = 0
+        self.client = None
+        self.deferred: deque = deque(maxlen=deferred_max)
+        self.on_deferred = None   # async callback(client, message) для отложенной проверки
+
+    @property
+    def tier(self) -> str:
+        return TIERS[self.level]
+
+    def depth(self) -> int:
+        depth = self.inflight
+        # Очередь апдейтов диспетчера Pyrogram (если доступна)
+        queue = getattr(getattr(self.client, "dispatcher", None), "updates_queue", None)
+        if queue is not None:
+            depth += queue.qsize()
+        return depth
+
+    @staticmethod
+    def _level_for(value: float, thresholds) -> int:
+        return sum(1 for t in thresholds if value >= t)
+
+    def _update(self, allow_decrease: bool):
+        if not self.enabled:
+            return
+        depth = self.depth()
+        target = min(len(TIERS) - 1, max(
+            self._level_for(depth, self.depth_thresholds),
+            self._level_for(self.lag, self.lag_thresholds),
+        ))
+        if target > self.level:
+            new = target
+        elif target < self.level and allow_decrease:
+            # Возвращаемся к полной точности по одному тиру за интервал
+            new = self.level - 1
+        else:
+            return
+        logger.warning(
+            f"Разгрузка: тир {self.tier} → {TIERS[new]} "
+            f"(очередь={depth}, лаг={self.lag:.2f} с, отложено={len(self.deferred)})"
+        )
+        self.level = new
+
+    def enter(self) -> str:
+        """Отмечает начало обработки сообщения и возвращает текущий тир."""
+        self.inflight += 1
+        self._update(allow_decrease=False)
+        return self.tier
+
+    def leave(self):
+        self.inflight -= 1
+
+    def defer(self, message):
+        """Откладывает сообщение до полной переоценки."""
+        if len(self.deferred) == self.deferred.maxlen:
+            logger.warning("Очередь отложенных сообщений переполнена, самое старое отброшено.")
+        self.deferred.append(message)
+
+    async def monitor(self, client=None, interval: float = 0.5):
+        """
+        Фоновая задача: меняет тир по глубине очереди и лагу event loop
+        (замеры сторожевого таймера) и разбирает отложенные.
+        """
+        self.client = client
+        while True:
+            await asyncio.sleep(interval)
+            self.lag = max(0.0, watchdog.take_lag())
+            self._update(allow_decrease=True)
+            if self.tier == TIER_FULL and self.deferred and self.on_deferred is not None:
+                await self._drain()
+
+    async def _drain(self, batch: int = 20):
+        for _ in range(min(batch, len(self.deferred))):
+            if self.tier != TIER_FULL:
+                return
+            message = self.deferred.popleft()
+            try:
+                await self.on_deferred(self.client, message)
+            except Exception as e:
+                logger.error(f"Ошибка отложенной проверки: {e}")
+
+
+shedder = LoadShedder()
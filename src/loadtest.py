@@ -0,0 +1,329 @@
+"""
+Офлайн-нагрузочный стенд для хэндлеров userbot.
+
+Синтетические или записанные сообщения прогоняются через register_handlers
+с заглушкой вместо Pyrogram-клиента. Заглушка имитирует задержки
+send_message/forward_messages и FloodWait (как Pyrogram, FloodWait не
+больше sleep_threshold пережидается и вызов повторяется, а больший
+пробрасывается), а стенд считает пропускную способность, задержку очереди и
+потерянные/опоздавшие уведомления.
+
+Пример:
+    python -m src.loadtest --rate 50 --chats 20 --duration 30 --flood 0.01
+    python -m src.loadtest --corpus messages.jsonl --rate 200
+    python -m src.loadtest --corpus recordings/ --rate 200
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import SimpleNamespace
+
+# Конфиг требует реальные значения — для офлайн-прогона подойдут любые
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("OWNER_ID", "0")
+
+from loguru import logger
+from pyrogram import StopPropagation, ContinuePropagation
+from pyrogram.enums import ChatType
+from pyrogram.errors import FloodWait
+from pyrogram.handlers import EditedMessageHandler, MessageHandler
+from pyrogram.types import Chat, Message, User
+
+from src.bot import register_handlers
+from src.keywords import load_keywords
+from src.config import KEYWORDS_FILE
+from src.workers import start_workers, stop_workers
+from src.load_shedding import shedder
+from src.watchdog import watchdog
+from src.recorder import iter_records
+
+# Сообщение, которое сейчас обрабатывает хэндлер (для атрибуции уведомлений)
+_current: contextvars.ContextVar["Sample | None"] = contextvars.ContextVar("loadtest_current", default=None)
+
+
+@dataclass
+class Sample:
+    """Метрики одного прогнанного сообщения."""
+    enqueued: float
+    started: float = 0.0
+    finished: float = 0.0
+    notified: float | None = None
+    dropped: bool = False
+
+
+@dataclass
+class Stats:
+    samples: list[Sample] = field(default_factory=list)
+    sends: int = 0
+    forwards: int = 0
+    forward_errors: int = 0
+    flood_waits: int = 0
+    flood_sleeps: int = 0   # FloodWait, переждённые внутри вызова
+    elapsed: float = 0.0
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+class FakeClient:
+    """
+    Заглушка Pyrogram Client: регистрирует хэндлеры и диспетчеризует их
+    так же, как Dispatcher (по группам, первый подходящий хэндлер в группе).
+    """
+
+    def __init__(self, stats: Stats, latency: float, jitter: float, flood_rate: float, flood_wait: int,
+                 sleep_threshold: float = 10):
+        self.me = User(id=1, is_self=True, first_name="loadtest", username="loadtest")
+        self.stats = stats
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        # Как Client.sleep_threshold: меньшие FloodWait Pyrogram пережидает в invoke
+        self.sleep_threshold = sleep_threshold
+        self.groups: dict[int, list] = {}
+        self.edited_groups: dict[int, list] = {}
+
+    # Синхронные фильтры (лямбды PENDING_ACTIONS в bot.py) Pyrogram запускает
+    # через client.loop.run_in_executor(client.executor, ...): отдаём текущий
+    # loop и его стандартный пул вместо отдельного ThreadPoolExecutor
+    executor = None
+
+    @property
+    def loop(self):
+        return asyncio.get_running_loop()
+
+    def _register(self, groups: dict[int, list], handler, group: int):
+        groups.setdefault(group, []).append(handler)
+        return dict(sorted(groups.items()))
+
+    def on_message(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.groups = self._register(self.groups, MessageHandler(func, filters), group)
+            return func
+        return decorator
+
+    def on_edited_message(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.edited_groups = self._register(self.edited_groups, EditedMessageHandler(func, filters), group)
+            return func
+        return decorator
+
+    async def _api_call(self):
+        while True:
+            delay = max(0.0, random.gauss(self.latency, self.jitter))
+            await asyncio.sleep(delay)
+            if random.random() >= self.flood_rate:
+                return
+            self.stats.flood_waits += 1
+            if self.flood_wait > self.sleep_threshold:
+                raise FloodWait(value=self.flood_wait)
+            self.stats.flood_sleeps += 1
+            await asyncio.sleep(self.flood_wait)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        sample = _current.get()
+        try:
+            await self._api_call()
+        except FloodWait:
+            if sample is not None and chat_id == "me":
+                sample.dropped = True
+            raise
+        self.stats.sends += 1
+        if sample is not None and chat_id == "me" and sample.notified is None:
+            sample.notified = time.perf_counter()
+
+    async def forward_messages(self, chat_id, from_chat_id, message_ids, **kwargs):
+        try:
+            await self._api_call()
+        except FloodWait:
+            self.stats.forward_errors += 1
+            raise
+        self.stats.forwards += 1
+
+    async def dispatch(self, message: Message, edited: bool = False):
+        for handlers in (self.edited_groups if edited else self.groups).values():
+            for handler in handlers:
+                try:
+                    if await handler.check(self, message):
+                        await handler.callback(self, message)
+                        break
+                except StopPropagation:
+                    return
+                except ContinuePropagation:
+                    continue
+
+
+def _synthetic_texts() -> list[str]:
+    keywords = load_keywords(KEYWORDS_FILE) or ["интернет"]
+    filler = (
+        "привет подскажите пожалуйста у нас дома опять не работает кто знает "
+        "что делать соседи вчера весь день было медленно тормозит пропал"
+    ).split()
+    texts = []
+    for _ in range(500):
+        words = random.choices(filler, k=random.randint(3, 40))
+        if random.random() < 0.3:
+            words.insert(random.randrange(len(words) + 1), random.choice(keywords))
+        texts.append(" ".join(words))
+    return texts
+
+
+def _load_corpus(path: str) -> list[dict]:
+    # JSONL, сжатый сегмент записи трафика или каталог сегментов
+    return [rec for rec in iter_records(path) if rec.get("text")]
+
+
+def _make_message(client: FakeClient, msg_id: int, chat_id: int, text: str) -> Message:
+    return Message(
+        client=client,
+        id=msg_id,
+        date=datetime.now(),
+        chat=Chat(id=chat_id, type=ChatType.SUPERGROUP, title=f"Чат {chat_id}"),
+        from_user=User(id=abs(chat_id) % 100000 + msg_id % 50, first_name="Тест"),
+        text=text,
+    )
+
+
+async def run_load(args) -> Stats:
+    stats = Stats()
+    client = FakeClient(stats, args.latency, args.jitter, args.flood, args.flood_wait, args.sleep_threshold)
+    register_handlers(client)
+
+    if args.corpus:
+        records = _load_corpus(args.corpus)
+    else:
+        records = [{"text": t} for t in _synthetic_texts()]
+    if not records:
+        raise SystemExit("Корпус пуст.")
+    chat_ids = [-1000000000000 - i for i in range(args.chats)]
+
+    queue: asyncio.Queue = asyncio.Queue()
+    # Разгрузка смотрит на очередь апдейтов так же, как у настоящего клиента
+    client.dispatcher = SimpleNamespace(updates_queue=queue)
+
+    async def consumer():
+        while True:
+            sample, message, edited = await queue.get()
+            sample.started = time.perf_counter()
+            token = _current.set(sample)
+            try:
+                await client.dispatch(message, edited)
+            except Exception as e:
+                logger.warning(f"Ошибка диспетчеризации: {e}")
+            finally:
+                _current.reset(token)
+                sample.finished = time.perf_counter()
+                queue.task_done()
+
+    consumers = [asyncio.create_task(consumer()) for _ in range(args.handler_workers)]
+    shedder.enabled = args.shed
+    monitor = asyncio.create_task(shedder.monitor(client))
+    # Отчёты о блокировках владельцу не шлём — только метрики
+    watchdog.start(None)
+
+    start = time.perf_counter()
+    deadline = start + args.duration
+    next_at = start
+    msg_id = 0
+    while time.perf_counter() < deadline:
+        msg_id += 1
+        rec = records[(msg_id - 1) % len(records)] if args.corpus else random.choice(records)
+        chat_id = rec.get("chat_id") or random.choice(chat_ids)
+        sample = Sample(enqueued=time.perf_counter())
+        stats.samples.append(sample)
+        queue.put_nowait((sample, _make_message(client, msg_id, chat_id, rec["text"]), False))
+        if random.random() < args.edits:
+            # Правка «опечатки»: тот же id, немного изменённый текст
+            edit = Sample(enqueued=time.perf_counter())
+            stats.samples.append(edit)
+            queue.put_nowait((edit, _make_message(client, msg_id, chat_id, rec["text"] + " (испр.)"), True))
+        next_at += random.expovariate(args.rate)
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+    try:
+        await asyncio.wait_for(queue.join(), timeout=args.drain_timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Очередь не разобрана за {args.drain_timeout} с, осталось {queue.qsize()}")
+    for task in consumers + [monitor]:
+        task.cancel()
+    watchdog.stop()
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def format_report(stats: Stats, late_after: float) -> str:
+    done = [s for s in stats.samples if s.finished]
+    lags = [s.started - s.enqueued for s in done]
+    handle = [s.finished - s.started for s in done]
+    notified = [s for s in done if s.notified is not None]
+    late = [s for s in notified if s.notified - s.enqueued > late_after]
+    dropped = [s for s in done if s.dropped and s.notified is None]
+    delivery = [s.notified - s.enqueued for s in notified]
+    elapsed = stats.elapsed or 1.0
+    return "\n".join([
+        "=== НАГРУЗОЧНЫЙ ТЕСТ ===",
+        f"Отправлено сообщений: {len(stats.samples)}, обработано: {len(done)}",
+        f"Пропускная способность: {len(done) / elapsed:.1f} msg/s",
+        f"Задержка очереди: p50={_percentile(lags, 50) * 1000:.1f} ms, "
+        f"p95={_percentile(lags, 95) * 1000:.1f} ms, max={max(lags, default=0) * 1000:.1f} ms",
+        f"Время хэндлера: p50={_percentile(handle, 50) * 1000:.1f} ms, "
+        f"p95={_percentile(handle, 95) * 1000:.1f} ms",
+        f"Уведомления: доставлено={len(notified)}, потеряно={len(dropped)}, "
+        f"опоздали (>{late_after:g} с)={len(late)}",
+        f"Доставка end-to-end: p50={_percentile(delivery, 50) * 1000:.1f} ms, "
+        f"p95={_percentile(delivery, 95) * 1000:.1f} ms",
+        f"Пересылки: успешно={stats.forwards}, ошибок={stats.forward_errors}, "
+        f"FloodWait всего={stats.flood_waits}, переждано={stats.flood_sleeps}",
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-нагрузочный тест хэндлеров userbot")
+    parser.add_argument("--corpus", help="JSONL (или .gz/.zst-сегменты, каталог записи трафика) с полями text и chat_id")
+    parser.add_argument("--rate", type=float, default=20.0, help="сообщений в секунду")
+    parser.add_argument("--chats", type=int, default=10, help="число синтетических чатов")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность подачи, с")
+    parser.add_argument("--latency", type=float, default=0.15, help="средняя задержка API, с")
+    parser.add_argument("--jitter", type=float, default=0.05, help="разброс задержки API, с")
+    parser.add_argument("--flood", type=float, default=0.0, help="вероятность FloodWait на вызов")
+    parser.add_argument("--flood-wait", type=int, default=5, help="значение FloodWait, с")
+    parser.add_argument("--sleep-threshold", type=float, default=10,
+                        help="FloodWait не больше порога пережидается и вызов повторяется, с (как у Pyrogram)")
+    parser.add_argument("--edits", type=float, default=0.0, help="доля сообщений, которые затем редактируются")
+    parser.add_argument("--late-after", type=float, default=5.0, help="порог опоздания уведомления, с")
+    parser.add_argument("--handler-workers", type=int, default=min(32, (os.cpu_count() or 0) + 4),
+                        help="параллельных хэндлеров (как workers у Pyrogram)")
+    parser.add_argument("--shed", action="store_true", help="включить адаптивную разгрузку")
+    parser.add_argument("--classifier-workers", type=int, default=0, help="префорк-воркеров классификатора")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="ожидание разбора очереди, с")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    start_workers(args.classifier_workers, log_level=args.log_level)
+    try:
+        stats = asyncio.run(run_load(args))
+    finally:
+        stop_workers()
+    print(format_report(stats, args.late_after))
+    print(f"\nЛаг event loop:\n{watchdog.format_report()}")
+    if args.shed:
+        print(f"Разгрузка: итоговый тир={shedder.tier}, отложено на полную проверку={len(shedder.deferred)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Нормализация текста перед лемматизацией и спам-фильтром.
+
+Сворачивает написания одного и того же слова к одной форме, чтобы ключи
+«вайфай», «вай-фай», «wi-fi», «wifi» лемматизировались и сравнивались один
+раз, а обфусцированный спам ловился существующими SPAM_REGEX:
+  – невидимые символы (мягкий перенос, zero-width) удаляются;
+  – в словах из смеси латиницы и кириллицы похожие буквы приводятся к
+    преобладающему алфавиту («интeрнет» с латинской e → «интернет»);
+  – буква, повторённая 3+ раз, схлопывается до двух («интернееет» →
+    «интернеет», дальше его ловит fuzzy); аббревиатуры капсом («ООО») и
+    ссылки не трогаются;
+  – транслитерации и раздельные написания из SUBSTITUTIONS («wi-fi»,
+    «вай фай», «юг линк») заменяются каноническим словом. Другие слова
+    через дефис («интернет-провайдер») не меняются.
+
+Таблицы str.translate и регулярные выражения компилируются один раз при
+импорте. Переводы строк не меняются.
+"""
+import re
+
+from src.config import NORMALIZE_TEXT
+
+# Невидимые символы удаляются, неразрывный пробел и дефисы-двойники
+# приводятся к обычным
+_BASE_TABLE = str.maketrans({
+    "\u00ad": None, "\u200b": None, "\u200c": None, "\u200d": None,
+    "\u2060": None, "\ufeff": None,
+    "\u00a0": " ", "\u2010": "-", "\u2011": "-",
+})
+
+# Латинские буквы, похожие на кириллические, и обратно
+_LATIN = "aceopxykABCEHKMOPTXY"
+_CYRILLIC = "асеорхукАВСЕНКМОРТХУ"
+_TO_CYRILLIC = str.maketrans(_LATIN, _CYRILLIC)
+_TO_LATIN = str.maketrans(_CYRILLIC + "іІ", _LATIN + "iI")
+
+_CYR_RE = re.compile(r"[а-яёіА-ЯЁІ]")
+_LAT_RE = re.compile(r"[a-zA-Z]")
+# Все выражения, которые проходят по всему тексту, линейны: слова и куски
+# без пробелов разбираются в колбэках, а не вложенными квантификаторами
+_WORD_RE = re.compile(r"[^\W\d_]+")
+_CHUNK_RE = re.compile(r"\S+")
+_REPEAT_RE = re.compile(r"([^\W\d_])\1{2,}")
+# Признаки ссылки или домена в куске текста без пробелов
+_URL_RE = re.compile(r"://|^www\.|\w\.[^\W\d_]{2}", re.IGNORECASE)
+
+# Транслитерации и раздельные написания → каноническое слово
+# (пробел в ключе означает пробелы или дефис в тексте)
+SUBSTITUTIONS = {
+    "wifi": "вайфай",
+    "wi fi": "вайфай",
+    "вай фай": "вайфай",
+    "вайфаи": "вайфай",
+    "юг линк": "юг-линк",
+    "юглинк": "юг-линк",
+    "цтс юг": "цтс-юг",
+    "dom.ru": "домру",
+    "дом.ru": "домру",
+    "дом.ру": "домру",
+    "annex.pro": "аннекс про",
+    "annex pro": "аннекс про",
+    "rostelecom": "ростелеком",
+    "beeline": "билайн",
+    "megafon": "мегафон",
+    "mts": "мтс",
+    "yota": "йота",
+    "spark": "спарк",
+}
+_SUBST_LOOKUP = {key.replace(" ", ""): value for key, value in SUBSTITUTIONS.items()}
+_SUBST_SEP_RE = re.compile(r"[\s-]+")
+_SUBST_RE = re.compile(
+    r"(?<![^\W_])(?:"
+    + "|".join(
+        r"(?:[ \t]+|-)".join(map(re.escape, key.split(" ")))
+        for key in sorted(SUBSTITUTIONS, key=len, reverse=True)
+    )
+    + r")(?![^\W_])",
+    re.IGNORECASE,
+)
+
+
+def _fix_mixed(m: re.Match) -> str:
+    word = m.group(0)
+    cyrillic = len(_CYR_RE.findall(word))
+    if not cyrillic:
+        return word
+    latin = len(_LAT_RE.findall(word))
+    if not latin:
+        return word
+    return word.translate(_TO_CYRILLIC if cyrillic >= latin else _TO_LATIN)
+
+
+def _squash_word(m: re.Match) -> str:
+    word = m.group(0)
+    if word.isupper():
+        return word
+    return _REPEAT_RE.sub(r"\1\1", word)
+
+
+def _squash(m: re.Match) -> str:
+    chunk = m.group(0)
+    if not _REPEAT_RE.search(chunk) or _URL_RE.search(chunk):
+        return chunk
+    return _WORD_RE.sub(_squash_word, chunk)
+
+
+def _substitute(m: re.Match) -> str:
+    key = _SUBST_SEP_RE.sub("", m.group(0)).lower()
+    return _SUBST_LOOKUP.get(key, m.group(0))
+
+
+def normalize(text: str) -> str:
+    """Нормализованный текст (переводы строк сохраняются)."""
+    if not NORMALIZE_TEXT or not text:
+        return text
+    text = text.translate(_BASE_TABLE)
+    if _LAT_RE.search(text) and _CYR_RE.search(text):
+        text = _WORD_RE.sub(_fix_mixed, text)
+    if _REPEAT_RE.search(text):
+        text = _CHUNK_RE.sub(_squash, text)
+    return _SUBST_RE.sub(_substitute, text)
@@ -0,0 +1,204 @@
+"""
+Постоянный кэш метаданных чатов и пиров.
+
+Хранит id, тип, название, username, access_hash (если известен) и время
+обновления в sessions/peers.json. Кэш прогревается в фоне постраничным
+обходом диалогов (вместо блокирующего обхода при старте) и обновляется по
+TTL. Уведомления берут из него название чата и ссылку без лишних запросов,
+а при «Peer id invalid» пир восстанавливается в сессии Pyrogram из
+сохранённого access_hash или username, и пересылка повторяется.
+"""
+import asyncio
+import json
+import os
+import time
+
+from loguru import logger
+from src.config import SESSION_FOLDER, PEER_CACHE_TTL
+
+PEER_CACHE_FILE = os.path.join(SESSION_FOLDER, "peers.json")
+
+# ChatType.value → тип пира в хранилище Pyrogram
+_STORAGE_TYPES = {
+    "private": "user",
+    "bot": "bot",
+    "group": "group",
+    "supergroup": "supergroup",
+    "channel": "channel",
+}
+# Типы чатов, у сообщений которых есть публичные ссылки t.me/<username>/<id>
+_LINKABLE_TYPES = ("channel", "supergroup")
+
+
+class PeerCache:
+    def __init__(self, path: str = PEER_CACHE_FILE, ttl: float = PEER_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.peers: dict[str, dict] = {}
+        self.last_warm = 0.0
+        self.failed: dict[tuple[int, int], int] = {}   # (chat_id, message_id) → попыток
+        self._dirty = False
+        self._task = None
+        self.load()
+
+    # --- хранение ---
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.peers = data.get("peers", {})
+            self.last_warm = data.get("last_warm", 0.0)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Кэш пиров не прочитан ({self.path}): {e}")
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"peers": self.peers, "last_warm": self.last_warm}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.error(f"Ошибка сохранения кэша пиров: {e}")
+
+    # --- чтение/запись записей ---
+
+    def get(self, chat_id: int) -> dict | None:
+        return self.peers.get(str(chat_id))
+
+    def remember_chat(self, chat):
+        """Запоминает метаданные pyrogram Chat (без сетевых запросов)."""
+        if chat is None:
+            return
+        title = chat.title or " ".join(filter(None, [chat.first_name, chat.last_name])) or None
+        chat_type = getattr(chat.type, "value", None)
+        entry = self.peers.get(str(chat.id))
+        if entry and entry.get("title") == title and entry.get("username") == chat.username \
+                and time.time() - entry.get("updated", 0) < self.ttl:
+            return
+        new = dict(entry or {})
+        new.update(type=chat_type, title=title, username=chat.username, updated=time.time())
+        self.peers[str(chat.id)] = new
+        self._dirty = True
+
+    async def remember_access(self, client, chat_id: int):
+        """Копирует access_hash из локального хранилища сессии (без запросов к API)."""
+        entry = self.get(chat_id)
+        if entry is None or entry.get("access_hash"):
+            return
+        try:
+            peer = await client.storage.get_peer_by_id(chat_id)
+        except Exception:
+            return
+        access_hash = getattr(peer, "access_hash", None)
+        if access_hash:
+            entry["access_hash"] = access_hash
+            self._dirty = True
+
+    def title(self, chat) -> str:
+        entry = self.get(chat.id)
+        return (entry or {}).get("title") or chat.title or str(chat.id)
+
+    def link(self, chat_id: int, message_id: int) -> str | None:
+        """
+        Ссылка на сообщение: публичная по username (только каналы и
+        супергруппы — у личных чатов и ботов ссылок на сообщения нет)
+        или t.me/c для супергрупп.
+        """
+        entry = self.get(chat_id) or {}
+        if entry.get("username") and entry.get("type") in _LINKABLE_TYPES:
+            return f"https://t.me/{entry['username']}/{message_id}"
+        if str(chat_id).startswith("-100"):
+            return f"https://t.me/c/{str(chat_id)[4:]}/{message_id}"
+        return None
+
+    # --- восстановление пиров ---
+
+    async def restore(self, client, chat_id: int) -> bool:
+        """Ленивое восстановление пира в сессии Pyrogram."""
+        entry = self.get(chat_id) or {}
+        storage_type = _STORAGE_TYPES.get(entry.get("type"))
+        try:
+            if entry.get("access_hash") and storage_type:
+                await client.storage.update_peers(
+                    [(chat_id, entry["access_hash"], storage_type, entry.get("username"), None)]
+                )
+                return True
+            # Без access_hash резолвим через API (username — дешевле, чем id)
+            chat = await client.get_chat(entry.get("username") or chat_id)
+            self.remember_chat(chat)
+            await self.remember_access(client, chat.id)
+            return True
+        except Exception as e:
+            logger.debug(f"Не удалось восстановить пир {chat_id}: {e}")
+            return False
+
+    def defer_forward(self, chat_id: int, message_id: int):
+        """Откладывает пересылку до повторной попытки в фоне."""
+        self.failed.setdefault((chat_id, message_id), 0)
+
+    async def _retry_failed(self, client, max_attempts: int = 3):
+        for (chat_id, message_id), attempts in list(self.failed.items()):
+            if await self.restore(client, chat_id):
+                try:
+                    await client.forward_messages("me", chat_id, message_id)
+                    logger.info(f"Отложенная пересылка {message_id} из чата {chat_id} выполнена.")
+                    self.failed.pop((chat_id, message_id), None)
+                    continue
+                except Exception as e:
+                    logger.debug(f"Повторная пересылка не удалась: {e}")
+            if attempts + 1 >= max_attempts:
+                logger.warning(f"Пересылка {message_id} из чата {chat_id} отброшена после {max_attempts} попыток.")
+                self.failed.pop((chat_id, message_id), None)
+            else:
+                self.failed[(chat_id, message_id)] = attempts + 1
+
+    # --- фоновый прогрев ---
+
+    async def _warm(self, client, batch: int = 50, pause: float = 1.0):
+        count = 0
+        async for dialog in client.get_dialogs():
+            self.remember_chat(dialog.chat)
+            await self.remember_access(client, dialog.chat.id)
+            count += 1
+            if count % batch == 0:
+                await asyncio.sleep(pause)
+        self.last_warm = time.time()
+        self._dirty = True
+        logger.info(f"Кэш пиров прогрет: диалогов {count}, всего записей {len(self.peers)}")
+
+    async def run(self, client, interval: float = 60.0):
+        """Фоновая задача: прогрев по TTL, повтор пересылок, сохранение на диск."""
+        while True:
+            try:
+                if time.time() - self.last_warm > self.ttl:
+                    await self._warm(client)
+                if self.failed:
+                    await self._retry_failed(client)
+                # У обычных групп access_hash нет — их не опрашиваем
+                missing = [int(k) for k, v in self.peers.items()
+                           if not v.get("access_hash") and v.get("type") != "group"]
+                for chat_id in missing[:100]:
+                    await self.remember_access(client, chat_id)
+                self.save()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Ошибка фонового обновления кэша пиров: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self, client):
+        self._task = asyncio.create_task(self.run(client))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.save()
+
+
+peer_cache = PeerCache()
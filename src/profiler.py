@@ -0,0 +1,182 @@
+"""
+Профилирование по запросу (команда /profile).
+
+На время окна включается cProfile в потоке event loop (хэндлеры и
+классификация без пула) и в воркерах классификатора: флаг лежит в общей
+памяти, созданной до fork, и воркер профилирует задачи, только пока он
+поднят. Статистика воркеров возвращается вместе с результатом задачи и
+сливается с родительской. Опционально поток-сэмплер снимает стеки event
+loop и пишет collapsed-stack файл для flamegraph.pl / speedscope.
+
+Когда профилирование выключено, накладных расходов нет: воркер читает
+один байт из общей памяти, cProfile и сэмплер не запущены.
+"""
+import asyncio
+import cProfile
+import multiprocessing
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from loguru import logger
+
+PROFILE_DIR = os.path.join(os.getcwd(), "profiles")
+
+# Флаг «идёт профилирование» в общей памяти — создаётся до fork воркеров
+_flag = multiprocessing.RawValue("b", 0)
+
+# Этапы конвейера: (суффикс файла, функция) для суммарного времени
+STAGES = {
+    "спам-фильтр": ("utils.py", "is_spam"),
+    "лемматизация spaCy": ("language.py", "__call__"),
+    "лемматизация (правки)": ("language.py", "pipe"),
+    "сопоставление": ("utils.py", "match_verdict"),
+    "уведомления": ("bot.py", "notify_match"),
+}
+
+
+class _StatsHolder:
+    """Обёртка над словарём cProfile-статистики для pstats.Stats.add()."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def is_active() -> bool:
+    return bool(_flag.value)
+
+
+def call_profiled(func, args):
+    """Выполняется в воркере: результат задачи и её статистика (если профилируем)."""
+    if not _flag.value:
+        return func(*args), None
+    prof = cProfile.Profile()
+    result = prof.runcall(func, *args)
+    prof.create_stats()
+    return result, prof.stats
+
+
+class _Session:
+    def __init__(self, flame: bool, interval: float):
+        self.profile = cProfile.Profile()
+        self.worker_stats: list[dict] = []
+        self.samples: Counter = Counter()
+        self.flame = flame
+        self.interval = interval
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _sample_loop(self, thread_id: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        if self.flame:
+            self._sampler = threading.Thread(
+                target=self._sample_loop, args=(threading.get_ident(),), daemon=True,
+            )
+            self._sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+
+_session: _Session | None = None
+
+
+def add_worker_stats(stats: dict):
+    """Принимает статистику задачи воркера (вызывается в родителе)."""
+    if _session is not None:
+        _session.worker_stats.append(stats)
+
+
+def _func_label(key) -> str:
+    filename, lineno, name = key
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{lineno}({name})"
+
+
+def _is_idle(key) -> bool:
+    # Ожидание событий в event loop — простой, а не работа
+    filename, _, name = key
+    return filename == "~" and ("poll" in name or "select" in name)
+
+
+def _build_report(session: _Session, seconds: float, top: int) -> str:
+    stats = pstats.Stats(session.profile)
+    for ws in session.worker_stats:
+        stats.add(_StatsHolder(ws))
+    lines = [
+        f"Окно: {seconds:g} с, задач воркеров профилировано: {len(session.worker_stats)}",
+        "",
+        "Этапы (суммарное время):",
+    ]
+    for stage, (suffix, name) in STAGES.items():
+        calls, cum = 0, 0.0
+        for (filename, _, func), (_, nc, _, ct, _) in stats.stats.items():
+            if func == name and filename.endswith(suffix):
+                calls += nc
+                cum += ct
+        if calls:
+            lines.append(f"  {stage}: {cum * 1000:.0f} ms, вызовов {calls}")
+    lines += ["", f"Топ-{top} функций по собственному времени (без ожидания в select/poll):"]
+    busy = [kv for kv in stats.stats.items() if not _is_idle(kv[0])]
+    ranked = sorted(busy, key=lambda kv: kv[1][2], reverse=True)[:top]
+    for key, (_, nc, tt, ct, _) in ranked:
+        lines.append(f"  {tt * 1000:.0f} ms self / {ct * 1000:.0f} ms cum, {nc} выз. — {_func_label(key)}")
+    return "\n".join(lines)
+
+
+def _write_collapsed(samples: Counter) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed")
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+async def profile_window(seconds: float, flame: bool = False, top: int = 20,
+                         interval: float = 0.005) -> tuple[str, str | None]:
+    """
+    Профилирует event loop и воркеры в течение seconds секунд.
+    Возвращает текст отчёта и путь к collapsed-stack файлу (если flame).
+    """
+    global _session
+    if _session is not None:
+        raise RuntimeError("Профилирование уже запущено")
+    session = _Session(flame, interval)
+    _session = session
+    _flag.value = 1
+    session.start()
+    started = time.perf_counter()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        session.stop()
+        _flag.value = 0
+        _session = None
+    elapsed = time.perf_counter() - started
+    logger.info(f"Профилирование завершено: {elapsed:.1f} с, задач воркеров: {len(session.worker_stats)}")
+    report = _build_report(session, elapsed, top)
+    collapsed = _write_collapsed(session.samples) if flame and session.samples else None
+    return report, collapsed
@@ -0,0 +1,223 @@
+"""
+Выборочная запись входящего трафика для бенчмарков и подбора правил.
+
+Хэндлер только кладёт запись (чат, время, текст, вердикт, ветка решения,
+тир) в ограниченную очередь без ожидания — при переполнении запись
+отбрасывается. Фоновый поток пишет записи в JSONL-сегменты, сжатые zstd
+(если установлен пакет zstandard) или gzip, и начинает новый сегмент, когда
+объём несжатых данных превышает RECORD_SEGMENT_MB. iter_records потоково
+читает сегменты обратно — их можно подать в `python -m src.loadtest --corpus`.
+
+С RECORD_ANONYMIZE=1 id чатов заменяются солёным хэшем, а в тексте
+маскируются ссылки, e-mail, упоминания и цифры телефонов (форма сохраняется,
+чтобы спам-шаблоны срабатывали так же).
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from loguru import logger
+from src.config import (
+    RECORD_SAMPLE_RATE, RECORD_DIR, RECORD_SEGMENT_MB, RECORD_ANONYMIZE, RECORD_QUEUE_SIZE,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Как часто сбрасывать сжатый поток на диск при простое, секунды
+FLUSH_INTERVAL = 5.0
+
+_STOP = object()
+
+# Ошибки чтения обрезанного сегмента
+_TRUNCATED = (EOFError, OSError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+_URL_RE = re.compile(r"(https?://[^/\s]+|t\.me)/\S*", re.IGNORECASE)
+_EMAIL_RE = re.compile(r"[\w.+-]+@([\w-]+\.)+\w+")
+_MENTION_RE = re.compile(r"(?<![\w@])@\w{3,}")
+_PHONE_RE = re.compile(r"\+?\d[\d\s()-]{5,}\d")
+
+
+def anonymize_text(text: str) -> str:
+    """Маскирует персональные данные, сохраняя форму текста."""
+    text = _URL_RE.sub(lambda m: f"{m.group(1)}/x", text)
+    text = _EMAIL_RE.sub("user@example.com", text)
+    text = _MENTION_RE.sub("@user", text)
+    return _PHONE_RE.sub(lambda m: re.sub(r"\d", "0", m.group(0)), text)
+
+
+def _open_segment(path: str):
+    raw = open(path, "wb")
+    if path.endswith(".zst"):
+        return raw, zstandard.ZstdCompressor(level=3).stream_writer(raw)
+    return raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+
+
+class TrafficRecorder:
+    def __init__(self, rate: float = RECORD_SAMPLE_RATE, directory: str = RECORD_DIR,
+                 segment_mb: float = RECORD_SEGMENT_MB, anonymize: bool = RECORD_ANONYMIZE,
+                 queue_size: int = RECORD_QUEUE_SIZE):
+        self.rate = rate
+        self.directory = directory
+        self.segment_bytes = int(segment_mb * 1024 * 1024)
+        self.anonymize = anonymize
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.recorded = 0
+        self.dropped = 0
+        self.segments = 0
+        self._salt = os.urandom(16)
+        self._thread = None
+        self._raw = None
+        self._stream = None
+        self._written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _chat_id(self, chat_id: int) -> int:
+        if not self.anonymize:
+            return chat_id
+        digest = hashlib.blake2b(str(chat_id).encode(), key=self._salt, digest_size=6).digest()
+        return -int.from_bytes(digest, "big")
+
+    def record(self, message, verdict):
+        """Вызывается в хэндлере: с вероятностью rate ставит сообщение в очередь записи."""
+        if self._thread is None or random.random() >= self.rate:
+            return
+        text = message.text or ""
+        date = getattr(message, "date", None)
+        rec = {
+            "chat_id": self._chat_id(message.chat.id),
+            "ts": date.timestamp() if date else time.time(),
+            "text": anonymize_text(text) if self.anonymize else text,
+            "matches": verdict.matches,
+            "branch": verdict.branch,
+            "tier": verdict.tier,
+        }
+        try:
+            self.queue.put_nowait(rec)
+        except queue.Full:
+            self.dropped += 1
+
+    # --- поток записи ---
+
+    def _rotate(self):
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        ext = ".jsonl.zst" if zstandard is not None else ".jsonl.gz"
+        path = os.path.join(self.directory, f"traffic-{datetime.now():%Y%m%d-%H%M%S}-{self.segments:04d}{ext}")
+        self._raw, self._stream = _open_segment(path)
+        self._written = 0
+        self.segments += 1
+        logger.info(f"Запись трафика: новый сегмент {path}")
+
+    def _close_segment(self):
+        if self._stream is None:
+            return
+        self._stream.close()
+        if not self._raw.closed:
+            self._raw.close()
+        self._stream = self._raw = None
+
+    def _flush(self):
+        if self._stream is None:
+            return
+        if isinstance(self._stream, gzip.GzipFile):
+            self._stream.flush()   # Z_SYNC_FLUSH: записанное уже читается
+        else:
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        self._raw.flush()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                rec = self.queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                rec = None
+            if rec is _STOP:
+                break
+            try:
+                if rec is not None:
+                    line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                    if self._stream is None or self._written + len(line) > self.segment_bytes:
+                        self._rotate()
+                    self._stream.write(line)
+                    self._written += len(line)
+                    self.recorded += 1
+                if time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    self._flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                logger.error(f"Ошибка записи трафика: {e}")
+        self._close_segment()
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+        self._thread.start()
+        codec = "zstd" if zstandard is not None else "gzip"
+        logger.info(f"Запись трафика включена: доля {self.rate:g}, {codec}, каталог {self.directory}")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        logger.info(f"Запись трафика остановлена: записано {self.recorded}, отброшено {self.dropped}")
+
+
+def _segment_paths(path: str) -> list[str]:
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.endswith((".jsonl", ".jsonl.gz", ".jsonl.zst"))
+        )
+    return [path]
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Для чтения {path} нужен пакет zstandard")
+        raw = open(path, "rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_records(path: str):
+    """
+    Потоково читает записи из JSONL-файла, сжатого сегмента или каталога
+    сегментов. Обрезанный хвост (сегмент, который ещё пишется) пропускается.
+    """
+    for segment in _segment_paths(path):
+        with _open_text(segment) as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+            except _TRUNCATED as e:
+                logger.debug(f"Сегмент {segment} прочитан не полностью: {e}")
+
+
+recorder = TrafficRecorder()
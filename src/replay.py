@@ -0,0 +1,183 @@
+"""
+Проверка на регрессии: повтор записанного трафика через текущий классификатор.
+
+Записи — сегменты src/recorder.py или файл, сохранённый этой же командой с
+--save: текст и вердикт, выданный тогда. Сообщения заново проходят через
+classify в полном тире, и выводятся расхождения вердиктов (записи дешёвых
+тиров только пересчитываются). Так проверяется, что переписанное ядро
+сопоставления или нормализация не меняют решения: сохраните вердикты до
+изменения, затем повторите их после — код возврата 1, если есть расхождения.
+
+Перед повтором проверяются встроенные случаи: NORMALIZE_CASES (нормализация,
+не зависит от модели), NORMALIZE_TIMING_CASES (нормализация сообщения
+предельной длины укладывается в бюджет — она выполняется и в дешёвых тирах
+в event loop) и MATCH_CASES (известные регрессии сопоставления).
+
+Пример:
+    python -m src.replay recordings/ --save before.jsonl.gz   # до изменения
+    python -m src.replay before.jsonl.gz                      # после
+    NORMALIZE_TEXT=0 python -m src.replay before.jsonl.gz     # без нормализации
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+# Конфиг требует реальные значения — для офлайн-прогона подойдут любые
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("OWNER_ID", "0")
+
+from loguru import logger
+
+from src.config import NORMALIZE_TEXT
+from src.normalize import normalize
+from src.recorder import iter_records
+from src.utils import classify, TIER_FULL
+
+# (текст, ожидаемый результат normalize)
+NORMALIZE_CASES = [
+    ("вай-фай, wi-fi, Wi Fi, wifi", "вайфай, вайфай, вайфай, вайфай"),
+    ("юг линк и Юг-Линк", "юг-линк и юг-линк"),
+    ("Подскажите интернет-провайдера", "Подскажите интернет-провайдера"),
+    ("кто-нибудь, кое-что", "кто-нибудь, кое-что"),
+    ("интернееет не работаааает", "интернеет не работаает"),
+    ("ООО Ростелеком", "ООО Ростелеком"),
+    ("www.site.ru/aaa", "www.site.ru/aaa"),
+    ("интeрнет от beeline", "интернет от билайн"),
+]
+
+# Сообщения, на которых регулярные выражения с вложенными квантификаторами
+# уходили в возвраты (секунды на 1000 символов, минуты на 4096 — лимит
+# Telegram): (название, текст)
+NORMALIZE_TIMING_CASES = [
+    ("смех и смесь алфавитов", "ах" * 300 + " ok, интернет"),
+    ("длинное латинское слово и кириллица", "a" * 1000 + " б"),
+    ("слитные слова разных алфавитов", ("x" * 500 + "я ") * 2),
+    ("повторы через дефис", "ааа-" * 1024),
+    ("точки между буквами", "a." * 2048 + "ааа"),
+]
+NORMALIZE_BUDGET = 0.05   # секунд на сообщение
+
+# (текст, ожидаемая ветка решения)
+MATCH_CASES = [
+    ("Подскажите интернет-провайдера, хочу подключить", "strict"),
+    ("Продам диван, недорого", "reject"),
+]
+
+
+def check_cases() -> list[str]:
+    """Встроенные случаи; возвращает описания несовпадений."""
+    failures = []
+    if NORMALIZE_TEXT:
+        for text, expected in NORMALIZE_CASES:
+            got = normalize(text)
+            if got != expected:
+                failures.append(f"normalize({text!r}) = {got!r}, ожидалось {expected!r}")
+        for name, text in NORMALIZE_TIMING_CASES:
+            started = time.perf_counter()
+            normalize(text)
+            elapsed = time.perf_counter() - started
+            if elapsed > NORMALIZE_BUDGET:
+                failures.append(
+                    f"normalize «{name}» ({len(text)} симв.): {elapsed:.3f} с, бюджет {NORMALIZE_BUDGET} с"
+                )
+    for text, branch in MATCH_CASES:
+        verdict = classify(text)
+        if verdict.branch != branch:
+            failures.append(
+                f"classify({text!r}): ветка {verdict.branch} ({verdict.matches}), ожидалась {branch}"
+            )
+    return failures
+
+
+def _key(matches) -> list[str]:
+    return sorted(matches or [])
+
+
+def replay(path: str, save: str | None = None, limit: int = 0) -> dict:
+    """Повторяет записи; при save записывает новые вердикты в JSONL(.gz)."""
+    stats = {"total": 0, "compared": 0, "gained": [], "lost": [], "changed": [], "elapsed": 0.0}
+    out = None
+    if save:
+        out = gzip.open(save, "wt", encoding="utf-8") if save.endswith(".gz") else open(save, "w", encoding="utf-8")
+    started = time.perf_counter()
+    try:
+        for rec in iter_records(path):
+            text = rec.get("text")
+            if not text:
+                continue
+            stats["total"] += 1
+            verdict = classify(text)
+            if out is not None:
+                out.write(json.dumps({
+                    "chat_id": rec.get("chat_id"),
+                    "ts": rec.get("ts"),
+                    "text": text,
+                    "matches": verdict.matches,
+                    "branch": verdict.branch,
+                    "tier": verdict.tier,
+                }, ensure_ascii=False) + "\n")
+            if "matches" in rec and rec.get("tier", TIER_FULL) == TIER_FULL:
+                stats["compared"] += 1
+                row = (text, rec["matches"], rec.get("branch"), verdict.matches, verdict.branch)
+                if bool(rec["matches"]) != bool(verdict):
+                    stats["gained" if verdict else "lost"].append(row)
+                elif _key(rec["matches"]) != _key(verdict.matches) or (
+                        rec.get("branch") and rec["branch"] != verdict.branch):
+                    stats["changed"].append(row)
+            if limit and stats["total"] >= limit:
+                break
+    finally:
+        if out is not None:
+            out.close()
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
+
+
+def format_report(stats: dict, show: int = 20) -> str:
+    lines = [
+        f"Записей: {stats['total']}, сравнено с записанным вердиктом: {stats['compared']}, "
+        f"время: {stats['elapsed']:.1f} с",
+        f"Стали приняты: {len(stats['gained'])}, перестали приниматься: {len(stats['lost'])}, "
+        f"другие ключи или ветка: {len(stats['changed'])}",
+    ]
+    for title, rows in (("Стали приняты", stats["gained"]), ("Перестали приниматься", stats["lost"]),
+                        ("Другие ключи или ветка", stats["changed"])):
+        if not rows or not show:
+            continue
+        lines += ["", f"{title} (первые {min(show, len(rows))}):"]
+        for text, old, old_branch, new, new_branch in rows[:show]:
+            lines.append(f"  {old_branch}:{old} → {new_branch}:{new}: {text.replace(chr(10), ' ')[:160]}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Повтор записанного трафика и проверка на регрессии")
+    parser.add_argument("records", nargs="?", help="сегмент, JSONL или каталог сегментов")
+    parser.add_argument("--save", help="записать новые вердикты в JSONL (.gz — сжатый)")
+    parser.add_argument("--limit", type=int, default=0, help="не больше N записей")
+    parser.add_argument("--show", type=int, default=20, help="сколько расхождений вывести")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    failures = check_cases()
+    print(f"Встроенные случаи: {'OK' if not failures else f'{len(failures)} не совпали'}")
+    for failure in failures:
+        print(f"  {failure}")
+    diffs = 0
+    if args.records:
+        stats = replay(args.records, args.save, args.limit)
+        print(format_report(stats, args.show))
+        diffs = len(stats["gained"]) + len(stats["lost"]) + len(stats["changed"])
+        if args.save:
+            print(f"\nВердикты записаны: {args.save}")
+    sys.exit(1 if failures or diffs else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Телеметрия правил: сколько раз срабатывает каждый ключ, группа и
+спам-шаблон, сколько стоит каждый спам-regex и сколько fuzzy-сравнений
+приходится на каждый ключ. По отчёту (/rulestats) видно мёртвые и дорогие
+правила, которые стоит удалить — меньший набор правил быстрее сопоставляется.
+
+Счётчики дешёвые: инкременты Counter на срабатываниях, время regex
+замеряется только на каждом TELEMETRY_SAMPLE_EVERY-м сообщении. В воркерах
+классификатора счётчики копятся локально и периодически возвращаются в
+родителя вместе с результатом задачи (drain/merge).
+"""
+import time
+from collections import Counter
+
+from src.config import TELEMETRY_SAMPLE_EVERY
+
+# Как часто воркер отдаёт накопленные счётчики родителю, секунды
+DRAIN_INTERVAL = 5.0
+
+_FIELDS = (
+    "keyword_hits", "fuzzy_hits", "fuzzy_only_accepts", "group_hits",
+    "spam_hits", "spam_time", "spam_runs", "fuzzy_stops",
+)
+
+
+class RuleTelemetry:
+    def __init__(self, sample_every: int = TELEMETRY_SAMPLE_EVERY):
+        self.sample_every = max(1, sample_every)
+        self.started = time.time()
+        self.messages = 0
+        self.sampled = 0
+        self.sampling = False
+        self._last_drain = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.messages = 0
+        self.sampled = 0
+        self.keyword_hits: Counter = Counter()        # оригинал ключа → exact/multi-word
+        self.fuzzy_hits: Counter = Counter()          # оригинал ключа → fuzzy
+        self.fuzzy_only_accepts: Counter = Counter()  # принято, а ключ найден только fuzzy
+        self.group_hits: Counter = Counter()          # группа → сообщений
+        self.spam_hits: Counter = Counter()           # шаблон → срабатываний
+        self.spam_time: Counter = Counter()           # шаблон → сек (на выборке)
+        self.spam_runs: Counter = Counter()           # шаблон → запусков (на выборке)
+        # Fuzzy-промах по лемме перебирает ключи до первого попадания:
+        # fuzzy_stops[n] — сколько раз перебор остановился после n ключей
+        self.fuzzy_stops: Counter = Counter()
+
+    def tick(self) -> bool:
+        """Новое сообщение; возвращает, попадает ли оно в выборку замеров."""
+        self.messages += 1
+        self.sampling = self.messages % self.sample_every == 0
+        if self.sampling:
+            self.sampled += 1
+        return self.sampling
+
+    # --- обмен с воркерами ---
+
+    def drain(self, force: bool = False) -> dict | None:
+        """Забирает накопленные счётчики (в воркере), не чаще DRAIN_INTERVAL."""
+        now = time.monotonic()
+        if not self.messages or (not force and now - self._last_drain < DRAIN_INTERVAL):
+            return None
+        self._last_drain = now
+        delta = {name: getattr(self, name) for name in _FIELDS}
+        delta["messages"], delta["sampled"] = self.messages, self.sampled
+        started = self.started
+        self.reset()
+        self.started = started
+        return delta
+
+    def merge(self, delta: dict):
+        """Добавляет счётчики воркера (в родителе)."""
+        for name in _FIELDS:
+            getattr(self, name).update(delta[name])
+        self.messages += delta["messages"]
+        self.sampled += delta["sampled"]
+
+    # --- отчёт ---
+
+    def report(self, keywords: list[str], spam_patterns: list[str], single_order: list[str],
+               merged: list[str] = (), top: int = 10) -> str:
+        """
+        Отчёт о мёртвых и дорогих правилах.
+        keywords — действующие ключи, single_order — однословные ключи в порядке
+        fuzzy-перебора, merged — варианты из файла, слитые нормализацией с другими.
+        """
+        hours = (time.time() - self.started) / 3600
+        lines = [
+            f"Период: {hours:.1f} ч, сообщений: {self.messages}, в выборке замеров: {self.sampled}",
+        ]
+
+        dead_kw = [k for k in keywords if not self.keyword_hits[k] and not self.fuzzy_hits[k]]
+        lines += ["", f"💤 Ключи без срабатываний ({len(dead_kw)} из {len(keywords)}):"]
+        lines += [f"  {k}" for k in dead_kw[:50]]
+        if len(dead_kw) > 50:
+            lines.append(f"  ... и ещё {len(dead_kw) - 50}")
+
+        if merged:
+            lines += ["", f"♻️ Варианты, совпавшие с другими ключами после нормализации ({len(merged)}):"]
+            lines += [f"  {k}" for k in merged]
+
+        dead_spam = [p for p in spam_patterns if not self.spam_hits[p]]
+        lines += ["", f"💤 Спам-шаблоны без срабатываний ({len(dead_spam)} из {len(spam_patterns)}):"]
+        lines += [f"  {p}" for p in dead_spam]
+
+        costs = sorted(
+            ((self.spam_time[p] / self.spam_runs[p], p) for p in self.spam_runs if self.spam_runs[p]),
+            reverse=True,
+        )[:top]
+        if costs:
+            lines += ["", "🐌 Самые дорогие спам-regex (среднее на сообщение):"]
+            lines += [f"  {cost * 1e6:.0f} µs — {p}" for cost, p in costs]
+
+        # Сравнений для i-го ключа = промахов, перебор которых дошёл дальше i
+        comparisons = Counter()
+        reached = sum(self.fuzzy_stops.values())
+        for i, kw in enumerate(single_order):
+            comparisons[kw] = reached
+            reached -= self.fuzzy_stops.get(i + 1, 0)
+        if comparisons:
+            lines += ["", "🔁 Больше всего fuzzy-сравнений (новых лемм):"]
+            lines += [f"  {n} — {kw}" for kw, n in comparisons.most_common(top)]
+        if self.fuzzy_hits:
+            lines += ["", "〰️ Fuzzy-срабатывания (кандидаты в ложные):"]
+            lines += [
+                f"  {kw}: {n} (принято только по fuzzy: {self.fuzzy_only_accepts[kw]})"
+                for kw, n in self.fuzzy_hits.most_common(top)
+            ]
+        if self.group_hits:
+            lines += ["", "🔧 Срабатывания групп:"]
+            lines += [f"  {g}: {n}" for g, n in self.group_hits.most_common()]
+        return "\n".join(lines)
+
+
+telemetry = RuleTelemetry()
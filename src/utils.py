@@ -1,9 +1,18 @@
+import os
 import re
+import time
+from array import array
+from dataclasses import dataclass, field
 from rapidfuzz import fuzz
 import spacy
 from loguru import logger
 from src.keywords import load_keywords, load_spam_patterns
-from src.config import KEYWORDS_FILE, SPAM_FILE
+from src.telemetry import telemetry
+from src.normalize import normalize
+from src.config import (
+    KEYWORDS_FILE, SPAM_FILE, LEMMA_CACHE_SIZE,
+    LONG_TEXT_CHARS, LONG_TEXT_MAX_CHARS, LONG_TEXT_TOKEN_BUDGET,
+)
 
 # Загрузка модели spaCy один раз
 nlp = spacy.load("ru_core_news_sm")
@@ -20,13 +29,16 @@ with open(_config_path, encoding="utf-8") as f:
 SINGLE_GROUP_MAP: dict[str, str] = {}
 MULTI_GROUP_PATTERNS: list[tuple[tuple[str], str]] = []
 for pattern, group in _raw_map.items():
-    doc = nlp(pattern)
+    doc = nlp(normalize(pattern))
     lemmas_pat = tuple(token.lemma_.lower() for token in doc if token.is_alpha)
     if len(lemmas_pat) == 1:
         SINGLE_GROUP_MAP[lemmas_pat[0]] = group
     elif len(lemmas_pat) > 1:
         MULTI_GROUP_PATTERNS.append((lemmas_pat, group))
 
+# Группы по нормализованному написанию паттерна («wifi» → группа «wi-fi»)
+_NORM_GROUPS: dict[str, str] = {normalize(p).lower(): g for p, g in _raw_map.items()}
+
 # Обратно совместимый GROUP_MAP: строковый паттерн → группа
 GROUP_MAP: dict[str, str] = {}
 for lemma, grp in SINGLE_GROUP_MAP.items():
@@ -34,6 +46,47 @@ for lemma, grp in SINGLE_GROUP_MAP.items():
 for lem_pat, grp in MULTI_GROUP_PATTERNS:
     GROUP_MAP[" ".join(lem_pat)] = grp
 
+# Компактное ядро: леммы правил интернированы в целочисленные ID,
+# группы — биты в маске. Сообщение превращается в array('i') из ID
+# (леммы, которых нет в правилах, получают UNKNOWN_ID).
+UNKNOWN_ID = -1
+LEMMA_IDS: dict[str, int] = {}
+GROUP_BITS: dict[str, int] = {}
+GROUP_NAMES: list[str] = []
+
+
+def lemma_id(lemma: str) -> int:
+    """ID леммы правила (заводит новый при первом обращении)."""
+    lid = LEMMA_IDS.get(lemma)
+    if lid is None:
+        lid = LEMMA_IDS[lemma] = len(LEMMA_IDS)
+    return lid
+
+
+def group_bit(group: str) -> int:
+    """Битовая маска группы (заводит новый бит при первом обращении)."""
+    bit = GROUP_BITS.get(group)
+    if bit is None:
+        bit = GROUP_BITS[group] = 1 << len(GROUP_NAMES)
+        GROUP_NAMES.append(group)
+    return bit
+
+
+def group_names(mask: int) -> list[str]:
+    return [name for i, name in enumerate(GROUP_NAMES) if mask >> i & 1]
+
+
+SINGLE_GROUP_MASK: dict[int, int] = {lemma_id(lem): group_bit(grp) for lem, grp in SINGLE_GROUP_MAP.items()}
+# ID первой леммы → [(array ID паттерна, маска группы), ...]
+MULTI_GROUP_BY_FIRST: dict[int, list[tuple[array, int]]] = {}
+for lem_pat, grp in MULTI_GROUP_PATTERNS:
+    ids_pat = array("i", map(lemma_id, lem_pat))
+    MULTI_GROUP_BY_FIRST.setdefault(ids_pat[0], []).append((ids_pat, group_bit(grp)))
+
+NETWORK_CONNECT = group_bit("network") | group_bit("connect")
+NETWORK_COMPLAINT = group_bit("network") | group_bit("complaint")
+OPERATOR = group_bit("operator")
+
 # Загружаем и компилируем шаблоны спама из keywords.py
 SPAM_PATTERNS = load_spam_patterns(SPAM_FILE)
 SPAM_REGEX = [re.compile(p, flags=re.IGNORECASE) for p in SPAM_PATTERNS]
@@ -46,6 +99,291 @@ MIN_MATCHES     = 1    # требуем минимум 2 совпадения к
 MIN_GROUPS      = 2    # из минимум 2 семантических групп
 MAX_TOKEN_DIST  = 10   # расстояние между ключевыми леммами
 
+# Тиры сопоставления при перегрузке (от полного к самому дешёвому)
+TIER_FULL       = "full"        # spaCy + exact + fuzzy + группы
+TIER_NO_FUZZY   = "no_fuzzy"    # без fuzzy-этапа
+TIER_EXACT      = "exact"       # без spaCy: леммы из кэша, только exact + группы
+TIER_SPAM_ONLY  = "spam_only"   # только спам-фильтр, полная проверка откладывается
+TIERS = (TIER_FULL, TIER_NO_FUZZY, TIER_EXACT, TIER_SPAM_ONLY)
+SPACY_TIERS = (TIER_FULL, TIER_NO_FUZZY)   # тиры, где работает spaCy
+
+# Ветки решения (какое правило приняло или отклонило сообщение)
+BRANCH_SPAM      = "spam"         # спам-фильтр
+BRANCH_DEFERRED  = "deferred"     # тир spam_only, решение отложено
+BRANCH_STRICT    = "strict"       # ключ + семантика network+connect
+BRANCH_OPERATOR  = "operator"     # ключ из группы operator
+BRANCH_SHORTCUT  = "shortcut"     # семантика network+connect без ключей
+BRANCH_SEMANTIC  = "semantic"     # ≥2 групп текста и ключей рядом по позиции
+BRANCH_COMPLAINT = "complaint"    # поздний shortcut network+complaint
+BRANCH_REJECT    = "reject"
+BRANCHES = (
+    BRANCH_SPAM, BRANCH_DEFERRED, BRANCH_STRICT, BRANCH_OPERATOR, BRANCH_SHORTCUT,
+    BRANCH_SEMANTIC, BRANCH_COMPLAINT, BRANCH_REJECT,
+)
+
+# Кэш «словоформа → лемма», наполняется при каждом проходе spaCy.
+# Тир exact читает его в родителе, поэтому воркеры копят новые записи
+# в _lemma_delta и возвращают их вместе с результатом задачи
+LEMMA_CACHE: dict[str, str] = {}
+_lemma_delta: dict[str, str] | None = None
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+# Длинные тексты: лексический префильтр по первым буквам слов правил
+PREFIX_LEN = 4
+_GAP = ""   # «пустая» лемма-разделитель между окнами, не совпадает ни с чем
+
+
+def _word_prefixes(text: str) -> set[str]:
+    return {w[:PREFIX_LEN] for w in _WORD_RE.findall(text.lower())}
+
+
+GROUP_PREFIXES: set[str] = set()
+for pattern in _raw_map:
+    GROUP_PREFIXES |= _word_prefixes(normalize(pattern))
+for lem_pat, _ in MULTI_GROUP_PATTERNS:
+    GROUP_PREFIXES |= _word_prefixes(" ".join(lem_pat))
+for lemma in SINGLE_GROUP_MAP:
+    GROUP_PREFIXES |= _word_prefixes(lemma)
+
+
+@dataclass
+class Verdict:
+    """Результат классификации с тиром и веткой решения, которые его выдали."""
+    matches: list[str] | None
+    tier: str = TIER_FULL
+    deferred: bool = False   # тир spam_only: нужна отложенная полная проверка
+    branch: str | None = None
+    groups: list[str] = field(default_factory=list)   # группы group_map, найденные в тексте
+
+    def __bool__(self):
+        return bool(self.matches)
+
+
+def token_lemma(token) -> str:
+    """Лемма токена spaCy; попутно пополняет LEMMA_CACHE."""
+    lemma = token.lemma_.lower()
+    if len(LEMMA_CACHE) < LEMMA_CACHE_SIZE:
+        if _lemma_delta is not None and token.lower_ not in LEMMA_CACHE:
+            _lemma_delta[token.lower_] = lemma
+        LEMMA_CACHE[token.lower_] = lemma
+    return lemma
+
+
+def track_lemmas():
+    """В воркере: начинает копить новые записи LEMMA_CACHE для родителя."""
+    global _lemma_delta
+    _lemma_delta = {}
+
+
+def drain_lemmas() -> dict[str, str] | None:
+    """В воркере: забирает записи LEMMA_CACHE, появившиеся с прошлого вызова."""
+    global _lemma_delta
+    if not _lemma_delta:
+        return None
+    delta, _lemma_delta = _lemma_delta, {}
+    return delta
+
+
+def merge_lemmas(delta: dict[str, str]):
+    """В родителе: добавляет записи воркера в LEMMA_CACHE."""
+    for word, lemma in delta.items():
+        if len(LEMMA_CACHE) >= LEMMA_CACHE_SIZE:
+            break
+        LEMMA_CACHE.setdefault(word, lemma)
+
+
+FUZZY_MEMO_SIZE = 50000   # лемм сообщения с запомненным fuzzy-результатом
+
+
+@dataclass
+class KeywordTables:
+    """Скомпилированные ключи: всё адресуется индексом ключа k."""
+    originals: list[str] = field(default_factory=list)          # k → оригинал
+    group_masks: list[int] = field(default_factory=list)        # k → бит группы по group_map.json
+    single: dict[int, int] = field(default_factory=dict)        # ID леммы → k
+    single_lemmas: list[tuple[str, int]] = field(default_factory=list)  # (лемма, k) в порядке файла
+    multi_by_first: dict[int, list[tuple[array, int]]] = field(default_factory=dict)  # ID → [(ID..., k)]
+    prefixes: set[str] = field(default_factory=set)             # префиксы слов ключей и групп
+    # лемма сообщения → (k, ratio) первого fuzzy-совпадения или None
+    fuzzy_memo: dict[str, tuple[int, float] | None] = field(default_factory=dict)
+
+
+# Кэш скомпилированных ключей: пересобирается только при изменении файла
+_KW_CACHE: dict = {"stamp": None, "tables": KeywordTables()}
+
+
+def compile_keywords(filepath: str = KEYWORDS_FILE) -> KeywordTables:
+    """
+    Лемматизирует ключевые слова и кэширует результат.
+
+    Таблицы пересобираются, только если файл ключей изменился (mtime/размер),
+    поэтому их можно один раз прогреть в родительском процессе перед fork.
+    """
+    try:
+        st = os.stat(filepath)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    if stamp is not None and _KW_CACHE["stamp"] == stamp:
+        return _KW_CACHE["tables"]
+
+    tables = KeywordTables(prefixes=set(GROUP_PREFIXES))
+    other = group_bit("other")
+    seen: dict[tuple[str, ...], int] = {}   # леммы ключа → k (варианты написания сливаются)
+    keywords = load_keywords(filepath)
+    for kw in keywords:
+        norm = normalize(kw)
+        lemmas = tuple(token_lemma(token) for token in nlp(norm) if token.is_alpha)
+        if not lemmas:
+            continue
+        tables.prefixes |= _word_prefixes(norm) | _word_prefixes(" ".join(lemmas))
+        mask = group_bit(_raw_map.get(kw) or _NORM_GROUPS.get(norm.lower(), "other"))
+        k = seen.get(lemmas)
+        if k is not None:
+            # Дубликат по леммам: группа берётся у первого варианта, где она задана
+            if tables.group_masks[k] == other:
+                tables.group_masks[k] = mask
+            continue
+        k = seen[lemmas] = len(tables.originals)
+        tables.originals.append(kw)
+        tables.group_masks.append(mask)
+        ids = array("i", map(lemma_id, lemmas))
+        if len(ids) == 1:
+            tables.single[ids[0]] = k
+            tables.single_lemmas.append((lemmas[0], k))
+        else:
+            tables.multi_by_first.setdefault(ids[0], []).append((ids, k))
+
+    _KW_CACHE.update(stamp=stamp, tables=tables)
+    logger.debug(
+        f"Ключи скомпилированы: в файле={len(keywords)}, после нормализации={len(tables.originals)}, "
+        f"single={len(tables.single)}"
+    )
+    return tables
+
+
+def _fuzzy_lookup(tables: KeywordTables, lemma: str) -> tuple[int, float] | None:
+    """Первый ключ (в порядке файла) с ratio ≥ 80; результат запоминается."""
+    memo = tables.fuzzy_memo
+    if lemma in memo:
+        return memo[lemma]
+    hit = None
+    compared = len(tables.single_lemmas)
+    for n, (key_lem, k) in enumerate(tables.single_lemmas, 1):
+        ratio = fuzz.ratio(lemma, key_lem)
+        if ratio >= 80:  # понижаем до 80%
+            hit = (k, ratio)
+            compared = n
+            break
+    telemetry.fuzzy_stops[compared] += 1
+    if len(memo) >= FUZZY_MEMO_SIZE:
+        memo.clear()
+    memo[lemma] = hit
+    return hit
+
+
+def is_spam(t_lower: str) -> bool:
+    """
+    Проверяет текст (в нижнем регистре) скомпилированными спам-regex.
+    На выборке сообщений (telemetry.tick) замеряет время каждого regex.
+    """
+    sampling = telemetry.tick()
+    for spam_re in SPAM_REGEX:
+        if sampling:
+            started = time.perf_counter()
+            found = spam_re.search(t_lower)
+            telemetry.spam_time[spam_re.pattern] += time.perf_counter() - started
+            telemetry.spam_runs[spam_re.pattern] += 1
+        else:
+            found = spam_re.search(t_lower)
+        if found:
+            telemetry.spam_hits[spam_re.pattern] += 1
+            logger.debug(f"Отфильтровано как спам по шаблону: {spam_re.pattern}")
+            return True
+    return False
+
+
+def lemmatize(text: str) -> list[str]:
+    """Леммы буквенных токенов текста в нижнем регистре."""
+    return [token_lemma(token) for token in nlp(text) if token.is_alpha]
+
+
+def lemmatize_cached(text: str) -> list[str]:
+    """
+    Дешёвая лемматизация без spaCy: слова ищутся в LEMMA_CACHE,
+    неизвестные остаются как есть (в нижнем регистре).
+    """
+    return [LEMMA_CACHE.get(w, w) for w in _WORD_RE.findall(text[:LONG_TEXT_MAX_CHARS].lower())]
+
+
+def lemmatize_long(text: str) -> list[str]:
+    """
+    Лемматизация длинного текста с ограниченной стоимостью.
+
+    Дешёвый лексический проход находит слова, похожие на слова правил
+    (по первым PREFIX_LEN буквам), и через spaCy проходят только окна
+    ±MAX_TOKEN_DIST слов вокруг них — не больше LONG_TEXT_TOKEN_BUDGET слов
+    и не дальше LONG_TEXT_MAX_CHARS символов. Между окнами вставляется
+    разделитель длиной больше MAX_TOKEN_DIST, чтобы совпадения из разных
+    окон не считались близкими.
+    """
+    text = text[:LONG_TEXT_MAX_CHARS]
+    prefixes = compile_keywords().prefixes
+    words = [(m.start(), m.end()) for m in _WORD_RE.finditer(text)]
+    candidates = [i for i, (a, b) in enumerate(words) if text[a:b].lower()[:PREFIX_LEN] in prefixes]
+    if not candidates:
+        return []
+
+    # Окна вокруг кандидатов, слитые при пересечении: [начало, конец, кандидатов]
+    windows: list[list[int]] = []
+    for c in candidates:
+        lo, hi = max(0, c - MAX_TOKEN_DIST), min(len(words) - 1, c + MAX_TOKEN_DIST)
+        if windows and lo <= windows[-1][1] + 1:
+            windows[-1][1] = hi
+            windows[-1][2] += 1
+        else:
+            windows.append([lo, hi, 1])
+
+    # В бюджет берём самые «плотные» окна, затем возвращаем порядок текста
+    if sum(hi - lo + 1 for lo, hi, _ in windows) > LONG_TEXT_TOKEN_BUDGET:
+        chosen, budget = [], LONG_TEXT_TOKEN_BUDGET
+        for lo, hi, n in sorted(windows, key=lambda w: w[2] / (w[1] - w[0] + 1), reverse=True):
+            if budget <= 0:
+                break
+            hi = min(hi, lo + budget - 1)
+            chosen.append([lo, hi, n])
+            budget -= hi - lo + 1
+        windows = sorted(chosen)
+
+    lemmas: list[str] = []
+    spans = (text[words[lo][0]:words[hi][1]] for lo, hi, _ in windows)
+    for doc in nlp.pipe(spans):
+        if lemmas:
+            lemmas.extend([_GAP] * (MAX_TOKEN_DIST + 1))
+        lemmas.extend(token_lemma(token) for token in doc if token.is_alpha)
+    logger.debug(f"Длинный текст: {len(text)} симв., окон={len(windows)}, лемм={len(lemmas)}")
+    return lemmas
+
+
+def classify(text: str, tier: str = TIER_FULL) -> Verdict:
+    """
+    Классификация с учётом тира нагрузки (текст предварительно нормализуется):
+      full      — спам-фильтр, spaCy, exact, fuzzy и группы
+      no_fuzzy  — то же без fuzzy-этапа
+      exact     — леммы только из кэша, exact и группы
+      spam_only — только спам-фильтр; не-спам помечается deferred
+    """
+    # Сначала режем до жёсткого предела, чтобы и нормализация была ограничена
+    text = normalize(str(text)[:LONG_TEXT_MAX_CHARS])
+    if is_spam(text.lower()):
+        return Verdict(None, tier, branch=BRANCH_SPAM)
+    if tier == TIER_SPAM_ONLY:
+        return Verdict(None, tier, deferred=True, branch=BRANCH_DEFERRED)
+    if tier == TIER_EXACT:
+        return match_verdict(lemmatize_cached(text), tier)
+    lemmas = lemmatize_long(text) if len(text) > LONG_TEXT_CHARS else lemmatize(text)
+    return match_verdict(lemmas, tier)
+
 
 def simple_keyword_match(text: str) -> list[str] | None:
     """
@@ -58,129 +396,120 @@ def simple_keyword_match(text: str) -> list[str] | None:
     
     Возвращает список найденных оригинальных ключей или None.
     """
-    text = str(text)
-    t_lower = text.lower()
+    return classify(text).matches
 
-    # 0) Спам-фильтр
-    # Проверяем спам с помощью скомпилированных regex
-    for spam_re in SPAM_REGEX:
-        if spam_re.search(t_lower):
-            logger.debug(f"Отфильтровано как спам по шаблону: {spam_re.pattern}")
-            return None
-        
-    # 1) Подготовка ключей
-    raw_keywords = load_keywords(KEYWORDS_FILE)
-    kw_single = {}   # лемма → оригинал
-    kw_multi  = []   # [(tuple(лемм...), оригинал), ...]
-
-    for kw in raw_keywords:
-        lemmas = tuple(token.lemma_.lower() for token in nlp(kw) if token.is_alpha)
-        if not lemmas:
-            continue
-        if len(lemmas) == 1:
-            kw_single.setdefault(lemmas[0], kw)
-        else:
-            kw_multi.append((lemmas, kw))
 
-    # 2) Лемматизация текста
-    doc    = nlp(text)
-    lemmas = [token.lemma_.lower() for token in doc if token.is_alpha]
-    
-    # Сопоставляем семантические группы: сначала многословные, затем одиночные
-    matched_groups = set()
-    # многословные группы
-    for lem_pat, group in MULTI_GROUP_PATTERNS:
-        L = len(lem_pat)
-        if L > len(lemmas):
-            continue
-        for i in range(len(lemmas) - L + 1):
-            if tuple(lemmas[i: i + L]) == lem_pat:
-                matched_groups.add(group)
-                break
-    # одиночные группы
-    for lemma in lemmas:
-        grp = SINGLE_GROUP_MAP.get(lemma)
-        if grp:
-            matched_groups.add(grp)
-            
-    matches      = set()
-    groups_found = set()
-    positions    = []
-
-    # 3) Multi-word match
-    for kw_lem, original in kw_multi:
-        L = len(kw_lem)
-        if L > len(lemmas):
+def match_verdict(lemmas: list[str], tier: str = TIER_FULL) -> Verdict:
+    """
+    Сопоставление лемм с ключами и группами: вердикт с веткой решения.
+    Общая часть для новых и отредактированных сообщений; fuzzy-этап
+    выполняется только в тире full.
+
+    Текст переводится в вектор ID лемм; exact-, групповые и позиционные
+    проверки идут по ID и битовым маскам групп.
+    """
+    # 2) Подготовка ключей (из кэша, лемматизируются только при изменении файла)
+    tables = compile_keywords()
+    get_id = LEMMA_IDS.get
+    ids = array("i", [get_id(lemma, UNKNOWN_ID) for lemma in lemmas])
+
+    matched_groups = 0    # маска групп по group_map (семантика текста)
+    groups_found   = 0    # маска групп найденных ключей
+    matches        = set()  # индексы ключей
+    positions      = []
+    seen_multi     = set()
+
+    for idx, lid in enumerate(ids):
+        if lid == UNKNOWN_ID:
             continue
-        for i in range(len(lemmas) - L + 1):
-            window = tuple(lemmas[i: i + L])
-            if window == kw_lem:
-                matches.add(original)
-                # Группа найденного ключевого шаблона по JSON-мапе
-                grp = _raw_map.get(original, "other")
-                groups_found.add(grp)
-                positions.append(i)
-                logger.info(f"Multi-word match '{original}' at pos {i}")
-                break
+        # Семантические группы: многословные и одиночные паттерны
+        for lem_pat, mask in MULTI_GROUP_BY_FIRST.get(lid, ()):
+            if ids[idx: idx + len(lem_pat)] == lem_pat:
+                matched_groups |= mask
+        matched_groups |= SINGLE_GROUP_MASK.get(lid, 0)
 
-    # 4) Single-word exact match
-    for idx, lemma in enumerate(lemmas):
-        if lemma in kw_single:
-            original = kw_single[lemma]
-            matches.add(original)
-            # Группа для одиночного слова
-            grp = _raw_map.get(original, "other")
-            groups_found.add(grp)
-            positions.append(idx)
-            logger.info(f"Single exact match '{original}' at pos {idx}")
-
-    # 5) Single-word fuzzy match — сразу первый hit
-    for idx, lemma in enumerate(lemmas):
-        for key_lem, original in kw_single.items():
-            ratio = fuzz.ratio(lemma, key_lem)
-            if ratio >= 80:  # понижаем до 80%
-                matches.add(original)
-                grp = _raw_map.get(original, "other")
-                groups_found.add(grp)
+        # 3) Multi-word match (первое вхождение каждого ключа)
+        for kw_ids, k in tables.multi_by_first.get(lid, ()):
+            if k not in seen_multi and ids[idx: idx + len(kw_ids)] == kw_ids:
+                seen_multi.add(k)
+                matches.add(k)
+                groups_found |= tables.group_masks[k]
                 positions.append(idx)
-                logger.info(f"Fuzzy match '{original}' ({ratio}%) at pos {idx}")
-                break
+                logger.info(f"Multi-word match '{tables.originals[k]}' at pos {idx}")
+
+        # 4) Single-word exact match
+        k = tables.single.get(lid)
+        if k is not None:
+            matches.add(k)
+            groups_found |= tables.group_masks[k]
+            positions.append(idx)
+            logger.info(f"Single exact match '{tables.originals[k]}' at pos {idx}")
+
+    # 5) Single-word fuzzy match — сразу первый hit (результат по лемме запоминается)
+    exact = set(matches)
+    fuzzy_found = set()
+    for idx, lemma in enumerate(lemmas if tier == TIER_FULL else ()):
+        hit = _fuzzy_lookup(tables, lemma)
+        if hit is not None:
+            k, ratio = hit
+            matches.add(k)
+            fuzzy_found.add(k)
+            groups_found |= tables.group_masks[k]
+            positions.append(idx)
+            logger.info(f"Fuzzy match '{tables.originals[k]}' ({ratio}%) at pos {idx}")
+
+    found = [tables.originals[k] for k in matches]
     # после этапа 5 (fuzzy)
-    logger.debug(f"After matching: matches={matches}, matched_groups={matched_groups}, groups_found={groups_found}, positions={positions}")
+    logger.debug(f"After matching: matches={found}, matched_groups={group_names(matched_groups)}, groups_found={group_names(groups_found)}, positions={positions}")
+
+    # Телеметрия правил: срабатывания ключей и групп
+    originals = tables.originals
+    telemetry.keyword_hits.update(originals[k] for k in exact)
+    telemetry.fuzzy_hits.update(originals[k] for k in fuzzy_found)
+    telemetry.group_hits.update(group_names(matched_groups))
+
+    result, branch = _decide(found, matches, matched_groups, groups_found, positions)
+    if result:
+        telemetry.fuzzy_only_accepts.update(originals[k] for k in fuzzy_found - exact)
+    return Verdict(result, tier, branch=branch, groups=group_names(matched_groups))
+
 
+def _decide(found: list[str], matches: set[int], matched_groups: int, groups_found: int,
+            positions: list[int]) -> tuple[list[str] | None, str]:
+    """Финальное решение по найденным ключам, маскам групп и позициям; возвращает и ветку."""
     # 6) Финальный фильтр
     # Итоговый фильтр: два пути к принятию сообщения
     # 1) Direct accept (strict): есть match и семантика «network»+«connect»
-    if matches and {'network','connect'}.issubset(matched_groups):
-        logger.info(f"Direct accept (strict): matches={matches}, matched_groups={matched_groups}")
-        return list(matches)
+    if matches and matched_groups & NETWORK_CONNECT == NETWORK_CONNECT:
+        logger.info(f"Direct accept (strict): matches={found}, matched_groups={group_names(matched_groups)}")
+        return found, BRANCH_STRICT
     # 1b) Direct accept for operator mentions
-    if matches and 'operator' in groups_found:
-        logger.info(f"Direct operator accept: matches={matches}, groups_found={groups_found}")
-        return list(matches)
+    if matches and groups_found & OPERATOR:
+        logger.info(f"Direct operator accept: matches={found}, groups_found={group_names(groups_found)}")
+        return found, BRANCH_OPERATOR
     # 2) Ранний semantic shortcut: если явная семантика «network+connect»
-    if {'network','connect'}.issubset(matched_groups):
-        logger.info(f"Semantic shortcut applied: {matched_groups}")
-        return list(matched_groups)
+    if matched_groups & NETWORK_CONNECT == NETWORK_CONNECT:
+        logger.info(f"Semantic shortcut applied: {group_names(matched_groups)}")
+        return group_names(matched_groups), BRANCH_SHORTCUT
 
     # 3) Семантический фильтр по группам и позиции
-    if len(matched_groups) >= MIN_GROUPS and len(groups_found) >= MIN_GROUPS \
+    if matched_groups.bit_count() >= MIN_GROUPS and groups_found.bit_count() >= MIN_GROUPS \
         and positions and (max(positions) - min(positions) <= MAX_TOKEN_DIST):
         logger.info(
-            f"Семантический фильтр: matched_groups={matched_groups}, "
-            f"groups_found={groups_found}, positions={positions}"
+            f"Семантический фильтр: matched_groups={group_names(matched_groups)}, "
+            f"groups_found={group_names(groups_found)}, positions={positions}"
         )
-        return list(matches)
+        return found, BRANCH_SEMANTIC
 
     # В остальных случаях отклоняем
-    logger.debug(f"Отклонено: matches={matches}, matched_groups={matched_groups}, groups_found={groups_found}, positions={positions}")
+    logger.debug(f"Отклонено: matches={found}, matched_groups={group_names(matched_groups)}, groups_found={group_names(groups_found)}, positions={positions}")
     
     # (перед последним return None)
     #  — если в тексте одновременно найдены две группы: сеть и запрос на подключение/жалобу,
     #    но не было точных matches, принимаем.
-    if {"network", "connect"} <= matched_groups or {"network", "complaint"} <= matched_groups:
-        logger.info(f"Semantic shortcut: {matched_groups} → accept")
-        return list(matched_groups)
+    if matched_groups & NETWORK_CONNECT == NETWORK_CONNECT or matched_groups & NETWORK_COMPLAINT == NETWORK_COMPLAINT:
+        logger.info(f"Semantic shortcut: {group_names(matched_groups)} → accept")
+        return group_names(matched_groups), BRANCH_COMPLAINT
 
     # Без совпадений групп и ключей отклоняем
-    return None
\ No newline at end of file
+    return None, BRANCH_REJECT
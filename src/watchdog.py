@@ -0,0 +1,183 @@
+"""
+Сторожевой таймер лага event loop.
+
+Задача в event loop раз в WATCHDOG_INTERVAL секунд отмечает «сердцебиение»
+и копит гистограмму лага (насколько позже запланированного она проснулась).
+Вспомогательный поток следит за сердцебиением: если loop не отвечает дольше
+WATCHDOG_THRESHOLD, поток снимает стек заблокировавшего кода вместе с чатом и
+длиной текста сообщения, которое обрабатывает задача, занявшая loop (хэндлеры
+Pyrogram работают параллельно, поэтому контекст хранится по задачам). После того как loop
+оживает, событие попадает в метрики (/lag) и отправляется владельцу (отдельной
+задачей, чтобы сердцебиение не ждало отправки). Замеры лага берёт и
+load_shedding (take_lag), а не меряет его второй раз.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+from loguru import logger
+from src.config import WATCHDOG_INTERVAL, WATCHDOG_THRESHOLD, WATCHDOG_NOTIFY_INTERVAL
+
+# Границы корзин гистограммы лага, секунды
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, float("inf"))
+
+
+class LagWatchdog:
+    def __init__(self, interval: float = WATCHDOG_INTERVAL, threshold: float = WATCHDOG_THRESHOLD,
+                 notify_interval: float = WATCHDOG_NOTIFY_INTERVAL):
+        self.interval = interval
+        self.threshold = threshold
+        self.notify_interval = notify_interval
+        self.histogram = [0] * len(LAG_BUCKETS)
+        self.samples = 0
+        self.max_lag = 0.0
+        self.recent_lag = 0.0   # максимум с прошлого take_lag()
+        self.stalls: deque = deque(maxlen=50)
+        # Задача event loop → (chat_id, длина текста) обрабатываемого сообщения
+        self._contexts: dict[asyncio.Task, tuple[int, int]] = {}
+        self._loop = None
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._capture = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+        self._last_notify = 0.0
+        self._notify_task = None
+
+    @contextmanager
+    def track(self, message):
+        """Отмечает сообщение, которое обрабатывает текущая задача event loop."""
+        task = asyncio.current_task()
+        previous = self._contexts.get(task)
+        self._contexts[task] = (message.chat.id, len(message.text or ""))
+        try:
+            yield
+        finally:
+            if previous is None:
+                self._contexts.pop(task, None)
+            else:
+                self._contexts[task] = previous
+
+    def _running_context(self) -> tuple[int, int] | None:
+        """Контекст задачи, которую loop выполняет прямо сейчас (из потока)."""
+        if self._loop is None:
+            return None
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+        return self._contexts.get(task)
+
+    def _observe(self, lag: float):
+        self.samples += 1
+        self.max_lag = max(self.max_lag, lag)
+        self.recent_lag = max(self.recent_lag, lag)
+        for i, bound in enumerate(LAG_BUCKETS):
+            if lag <= bound:
+                self.histogram[i] += 1
+                break
+
+    def _watch(self):
+        """Поток: снимает стек, если loop не отвечает дольше порога."""
+        while not self._stop.wait(self.interval / 2):
+            stalled = time.monotonic() - self._beat
+            if stalled < self.threshold or self._capture is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame, limit=20)) if frame else ""
+            self._capture = {
+                "at": time.time(),
+                "context": self._running_context(),
+                "stack": stack,
+            }
+
+    async def _heartbeat(self, client):
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        while True:
+            start = loop.time()
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._beat = time.monotonic()
+            self._observe(lag)
+            if self._capture is not None:
+                event, self._capture = self._capture, None
+                event["lag"] = lag
+                self.stalls.append(event)
+                logger.warning(
+                    f"Event loop заблокирован на {lag:.2f} с, контекст={event['context']}\n{event['stack']}"
+                )
+                self._notify_task = asyncio.create_task(self._notify(client, event))
+
+    def take_lag(self) -> float:
+        """
+        Наибольший лаг с прошлого вызова, включая ещё не закончившуюся
+        блокировку (сердцебиение опаздывает прямо сейчас).
+        """
+        lag, self.recent_lag = self.recent_lag, 0.0
+        if self._task is None or self._task.done():
+            return lag
+        return max(lag, time.monotonic() - self._beat - self.interval)
+
+    async def _notify(self, client, event: dict):
+        now = time.monotonic()
+        if client is None or now - self._last_notify < self.notify_interval:
+            return
+        self._last_notify = now
+        chat_id, text_len = event["context"] or (None, None)
+        text = (
+            f"🐢 Event loop заблокирован на {event['lag']:.2f} с\n"
+            f"Чат: {chat_id}, длина текста: {text_len}\n\n"
+            f"{event['stack'][-3000:]}"
+        )
+        try:
+            await client.send_message("me", text, disable_web_page_preview=True)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить отчёт о лаге: {e}")
+
+    def start(self, client=None):
+        """Запускает задачу-сердцебиение и поток-наблюдатель (из работающего loop)."""
+        self._stop.clear()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat(client))
+        self._thread = threading.Thread(target=self._watch, name="lag-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def format_report(self) -> str:
+        lines = [
+            f"Замеров: {self.samples}, максимум: {self.max_lag * 1000:.0f} ms, "
+            f"порог: {self.threshold * 1000:.0f} ms",
+            "",
+            "Гистограмма лага:",
+        ]
+        lower = 0.0
+        for bound, count in zip(LAG_BUCKETS, self.histogram):
+            label = f"> {lower * 1000:.0f} ms" if bound == float("inf") else f"≤ {bound * 1000:.0f} ms"
+            lines.append(f"  {label}: {count}")
+            lower = bound
+        if self.stalls:
+            lines += ["", f"Последние блокировки ({len(self.stalls)}):"]
+            for event in list(self.stalls)[-5:]:
+                chat_id, text_len = event["context"] or (None, None)
+                last_frame = event["stack"].strip().splitlines()[-2:] if event["stack"] else []
+                lines.append(
+                    f"  {time.strftime('%H:%M:%S', time.localtime(event['at']))} "
+                    f"{event['lag']:.2f} с, чат={chat_id}, длина={text_len}"
+                )
+                lines += [f"    {line.strip()}" for line in last_frame]
+        return "\n".join(lines)
+
+
+watchdog = LagWatchdog()
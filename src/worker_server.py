@@ -0,0 +1,16 @@
+"""
+Предзагрузка fork-сервера воркеров классификатора.
+
+Модуль импортируется один раз в процессе fork-сервера (multiprocessing
+forkserver), который запускается чистым интерпретатором без потоков бота.
+Здесь загружается модель spaCy, компилируются таблицы ключей и замораживается
+куча — каждый воркер, в том числе перезапущенный после WORKER_MAX_TASKS
+сообщений, форкается из этого одинакового однопоточного состояния.
+"""
+import gc
+
+from src import utils
+
+utils.compile_keywords()
+gc.collect()
+gc.freeze()
@@ -0,0 +1,192 @@
+"""
+Префорк-воркеры классификатора.
+
+Воркеры форкаются не из родителя, а из fork-сервера (multiprocessing
+forkserver): это отдельный однопоточный процесс, который один раз загружает
+модель spaCy, компилирует таблицы ключей/групп и замораживает кучу через
+gc.freeze() (см. src/worker_server.py). Страницы с моделью и таблицами
+остаются общими для воркеров (copy-on-write), а не копируются в каждый.
+Воркеры перезапускаются после WORKER_MAX_TASKS сообщений, чтобы ограничить
+рост памяти; новые воркеры форкаются из того же сервера, а не из работающего
+родителя с потоками Pyrogram, сторожевого таймера и записи трафика.
+"""
+import asyncio
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import signal
+import sys
+
+from loguru import logger
+from src.config import CLASSIFIER_WORKERS, WORKER_MAX_TASKS, WORKER_TASK_TIMEOUT
+from src import profiler, utils
+from src.telemetry import telemetry
+
+_pool = None
+_max_tasks = 0
+_tasks_done = 0   # в воркере: выполнено задач
+
+
+def _worker_init(profile_flag, max_tasks: int, log_level: str):
+    global _max_tasks
+    # Ctrl+C обрабатывает родитель, воркеры завершаются через terminate()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Воркер форкнут из fork-сервера: флаг профилирования и настройки берём у родителя
+    profiler._flag = profile_flag
+    _max_tasks = max_tasks
+    utils.track_lemmas()
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+    logger.debug(f"Воркер классификатора запущен: pid={os.getpid()}")
+
+
+def start_workers(processes: int = CLASSIFIER_WORKERS, max_tasks: int = WORKER_MAX_TASKS,
+                  log_level: str = "INFO"):
+    """Запускает fork-сервер (модель и таблицы грузятся в нём) и пул воркеров."""
+    global _pool
+    if processes <= 0 or _pool is not None:
+        return _pool
+    ctx = multiprocessing.get_context("forkserver")
+    # __main__ тоже импортируется один раз в сервере, а не в каждом воркере
+    ctx.set_forkserver_preload(["__main__", "src.worker_server"])
+    _pool = ctx.Pool(
+        processes=processes,
+        initializer=_worker_init,
+        initargs=(profiler._flag, max_tasks, log_level),
+        maxtasksperchild=max_tasks or None,
+    )
+    logger.info(f"Запущено воркеров классификатора: {processes} (перезапуск каждые {max_tasks or '∞'} сообщений)")
+    return _pool
+
+
+def stop_workers():
+    """Останавливает пул воркеров."""
+    global _pool
+    if _pool is None:
+        return
+    _pool.terminate()
+    _pool.join()
+    _pool = None
+    logger.info("Воркеры классификатора остановлены.")
+
+
+def _task(func, args):
+    """
+    Выполняется в воркере: результат, статистика профиля, накопленная
+    телеметрия правил (перед перезапуском воркера — обязательно) и новые
+    записи LEMMA_CACHE.
+    """
+    global _tasks_done
+    result, stats = profiler.call_profiled(func, args)
+    _tasks_done += 1
+    counters = telemetry.drain(force=bool(_max_tasks) and _tasks_done >= _max_tasks)
+    return result, stats, counters, utils.drain_lemmas()
+
+
+def _resolve(fut: asyncio.Future, result=None, exc: BaseException | None = None):
+    if fut.done():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
+
+
+async def run(func, *args):
+    """
+    Выполняет func(*args) в пуле воркеров, не блокируя event loop.
+    Без пула (CLASSIFIER_WORKERS=0) вызывает функцию в текущем процессе.
+
+    Pool не вызывает ни один колбэк для задачи, чей воркер был убит (OOM,
+    SIGKILL), — убитого воркера он заменяет, но задача теряется. Поэтому ответ
+    ждём не дольше WORKER_TASK_TIMEOUT, а потом выполняем задачу в потоке
+    основного процесса: хэндлер не зависает и не держит счётчики разгрузки.
+    """
+    if _pool is None:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    _pool.apply_async(
+        _task, (func, args),
+        callback=lambda res: loop.call_soon_threadsafe(_resolve, fut, res),
+        error_callback=lambda exc: loop.call_soon_threadsafe(_resolve, fut, None, exc),
+    )
+    try:
+        result, stats, counters, lemmas = await asyncio.wait_for(fut, WORKER_TASK_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(
+            f"Воркер не ответил за {WORKER_TASK_TIMEOUT:g} с ({getattr(func, '__name__', func)}), "
+            f"выполняем в основном процессе"
+        )
+        return await loop.run_in_executor(None, func, *args)
+    if stats is not None:
+        profiler.add_worker_stats(stats)
+    if counters is not None:
+        telemetry.merge(counters)
+    if lemmas is not None:
+        utils.merge_lemmas(lemmas)
+    return result
+
+
+def _read_smaps(pid: int) -> dict[str, int] | None:
+    """Читает /proc/<pid>/smaps_rollup (значения в kB)."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    stats = {}
+    for line in lines[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[1].isdigit():
+            stats[parts[0].rstrip(":")] = int(parts[1])
+    return stats
+
+
+def memory_report() -> list[dict]:
+    """
+    Память родителя и каждого воркера: RSS, PSS, уникальная (Private_*)
+    и общая (Shared_*) часть в kB.
+    """
+    pids = [("parent", os.getpid())]
+    if _pool is not None:
+        # Ни forkserver, ни Pool не дают публичного списка процессов
+        server_pid = multiprocessing.forkserver._forkserver._forkserver_pid
+        if server_pid:
+            pids.append(("forkserver", server_pid))
+        pids += [("worker", p.pid) for p in _pool._pool if p.pid]
+    report = []
+    for role, pid in pids:
+        smaps = _read_smaps(pid)
+        if smaps is None:
+            continue
+        report.append({
+            "role": role,
+            "pid": pid,
+            "rss": smaps.get("Rss", 0),
+            "pss": smaps.get("Pss", 0),
+            "unique": smaps.get("Private_Clean", 0) + smaps.get("Private_Dirty", 0),
+            "shared": smaps.get("Shared_Clean", 0) + smaps.get("Shared_Dirty", 0),
+        })
+    return report
+
+
+def format_memory_report() -> str:
+    """Текстовый отчёт о памяти для логов и команды /workers."""
+    report = memory_report()
+    if not report:
+        return "Нет данных о памяти (нужен Linux с /proc/<pid>/smaps_rollup)."
+    lines = [f"Воркеров: {sum(r['role'] == 'worker' for r in report)}"]
+    for r in report:
+        lines.append(
+            f"{r['role']} pid={r['pid']}: RSS={r['rss'] // 1024} MB, PSS={r['pss'] // 1024} MB, "
+            f"unique={r['unique'] // 1024} MB, shared={r['shared'] // 1024} MB"
+        )
+    workers = [r for r in report if r["role"] == "worker"]
+    if workers:
+        total_pss = sum(r["pss"] for r in report)
+        lines.append(
+            f"Итого PSS={total_pss // 1024} MB, "
+            f"на воркер unique≈{sum(r['unique'] for r in workers) // len(workers) // 1024} MB"
+        )
+    return "\n".join(lines)